@@ -0,0 +1,171 @@
+"""Benchmark the segment cutter on synthetic media.
+
+    python benchmarks/bench.py --out results.json
+    python benchmarks/bench.py --stub --sources 500 --segments 2000 --out orchestration.json
+
+The default run builds lavfi test videos (several resolutions, lengths and
+containers) and times scan, plan and run for every encoding mode and worker
+count, and with --layouts the output container layouts against faststart.
+--stub puts the stand-in ffmpeg/ffprobe from benchmarks/stubs first in
+the PATH, so only the Python orchestration overhead is measured. Results are
+written as JSON so runs can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import MediaCatalog  # noqa: E402
+from cutting import COPY, FASTSTART, OUTPUT_LAYOUTS, REENCODE, SMART  # noqa: E402
+from engine import SegmentEngine  # noqa: E402
+
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+
+# (width, height, seconds, container)
+SOURCES = [
+    (640, 360, 30, "mp4"),
+    (1280, 720, 60, "mp4"),
+    (1920, 1080, 60, "mkv"),
+    (1280, 720, 120, "mov"),
+]
+
+
+def make_sources(folder, sources=SOURCES):
+    """Render lavfi test videos with a 2 second GOP into folder."""
+    for width, height, seconds, container in sources:
+        output = os.path.join(folder, f"test_{width}x{height}_{seconds}s.{container}")
+        subprocess.run([
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=25",
+            "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+            "-t", str(seconds),
+            "-c:v", "libx264", "-preset", "veryfast", "-g", "50",
+            "-c:a", "aac",
+            output
+        ], check=True)
+
+
+def make_stub_sources(folder, count):
+    """Create empty files for the stub ffprobe to describe."""
+    for i in range(count):
+        open(os.path.join(folder, f"stub_{i:06d}.mp4"), "wb").close()
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def run_case(input_folder, mode, workers, duration, segments, layout=FASTSTART):
+    """Time one cold-catalog job, stage by stage."""
+    with tempfile.TemporaryDirectory(prefix="bench_out_") as output_folder:
+        catalog = MediaCatalog(os.path.join(output_folder, "catalog.sqlite3"))
+        events = []
+        segment_engine = SegmentEngine(catalog, workers, mode, on_progress=events.append, layout=layout)
+        input_files, scan_seconds = timed(segment_engine.scan, input_folder)
+        # A second scan shows the cost of a warm catalog
+        _, rescan_seconds = timed(segment_engine.scan, input_folder)
+        planned, plan_seconds = timed(segment_engine.plan, input_files, output_folder, duration, segments)
+        result, run_seconds = timed(segment_engine.run, planned)
+        extension = OUTPUT_LAYOUTS[layout]["extension"]
+        output_bytes = sum(os.path.getsize(os.path.join(output_folder, f))
+                           for f in os.listdir(output_folder) if f.endswith(extension))
+        # Time ffmpeg spent after its last progress report, where the faststart rewrite happens
+        finalize_seconds, _ = segment_engine.metrics.stage_seconds("finalize")
+        catalog.close()
+    total_seconds = scan_seconds + plan_seconds + run_seconds
+    return {
+        "mode": mode,
+        "layout": layout,
+        "streamable": OUTPUT_LAYOUTS[layout]["streamable"],
+        "workers": workers,
+        "sources": len(input_files),
+        "duration": duration,
+        "requested": segments,
+        "planned": len(planned),
+        "created": result["created"],
+        "failed": result["total"] - result["created"],
+        "progress_events": len(events),
+        "scan_seconds": scan_seconds,
+        "rescan_seconds": rescan_seconds,
+        "plan_seconds": plan_seconds,
+        "run_seconds": run_seconds,
+        "total_seconds": total_seconds,
+        "segments_per_second": result["created"] / total_seconds if total_seconds else 0.0,
+        "finalize_seconds": finalize_seconds,
+        "output_bytes": output_bytes,
+        "blocks_in": result["usage"]["blocks_in"],
+        "blocks_out": result["usage"]["blocks_out"],
+    }
+
+
+def ffmpeg_version():
+    try:
+        lines = subprocess.check_output(["ffmpeg", "-version"]).decode().splitlines()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return lines[0] if lines else "stub"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the segment cutter.")
+    parser.add_argument("--out", default="bench_results.json", help="JSON results file")
+    parser.add_argument("--stub", action="store_true", help="Use stub ffmpeg/ffprobe to time orchestration only")
+    parser.add_argument("--sources", type=int, default=200, help="Number of stub sources (--stub only)")
+    parser.add_argument("--media", help="Reuse an existing folder of test videos instead of rendering them")
+    parser.add_argument("--modes", nargs="+", default=[REENCODE, COPY, SMART], choices=(REENCODE, COPY, SMART))
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--duration", type=int, default=5, help="Segment duration in seconds")
+    parser.add_argument("--segments", type=int, default=20, help="Segments per case")
+    parser.add_argument("--layouts", nargs="+", default=[FASTSTART], choices=OUTPUT_LAYOUTS,
+                        help="Output layouts to compare (default faststart only)")
+    args = parser.parse_args(argv)
+
+    if args.stub:
+        os.environ["PATH"] = STUBS_DIR + os.pathsep + os.environ.get("PATH", "")
+    elif not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        parser.error("ffmpeg and ffprobe must be in the PATH (or use --stub)")
+
+    with tempfile.TemporaryDirectory(prefix="bench_media_") as media_folder:
+        if args.media:
+            media_folder = args.media
+        elif args.stub:
+            make_stub_sources(media_folder, args.sources)
+        else:
+            make_sources(media_folder)
+
+        cases = []
+        for layout in args.layouts:
+            for mode in args.modes:
+                for workers in sorted(set(args.workers)):
+                    case = run_case(media_folder, mode, workers, args.duration, args.segments, layout)
+                    cases.append(case)
+                    print(f"{layout:>10} {mode:>8} workers={workers:<3} {case['created']:>5} segments "
+                          f"in {case['total_seconds']:.2f}s ({case['segments_per_second']:.2f}/s, "
+                          f"finalize {case['finalize_seconds']:.2f}s, {case['blocks_out']} blocks written)",
+                          file=sys.stderr)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "stub": args.stub,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version(),
+        "cases": cases,
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Content-addressed store of finished segments.
+
+A segment is identified by its source (path, size, modification time), start,
+duration and encoding settings, so asking for the same cut again is served by
+linking the stored file instead of running ffmpeg. The store is kept under a
+size budget by evicting the least recently used files.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from cutting import COPY, FASTSTART, codec_args
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".segmentcutter", "cache")
+DEFAULT_CACHE_BYTES = 10 * 1024 ** 3
+
+
+def segment_key(input_file, start_time, duration, mode, layout=FASTSTART, rendition=None, streams=None):
+    """Return the hex key of a cut; the start is taken to the millisecond, which is what the plan keeps."""
+    path = os.path.abspath(input_file)
+    st = os.stat(path)
+    identity = [path, st.st_size, st.st_mtime_ns, f"{start_time:.3f}", f"{float(duration):.3f}", mode,
+                codec_args(mode), layout]
+    if rendition is not None:
+        identity.append(list(rendition))  # Keys of full-size cuts stay what they were
+    copied = [decision.stream for decision in streams or () if decision.action == COPY]
+    if copied and mode != COPY:
+        identity.append(copied)  # A copied track is not the encoded one, fully encoded cuts keep their keys
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+
+
+def part_path(output_file):
+    """Where ffmpeg writes an output before it is renamed into place, keeping the extension for the muxer."""
+    root, ext = os.path.splitext(output_file)
+    return f"{root}.part{ext}"
+
+
+def _link_or_copy(source, destination, allow_copy=True):
+    """Put a copy of source at destination atomically, as a hard link when both are on the same file system.
+
+    With allow_copy False nothing is written when a link is not possible; returns whether destination was written.
+    """
+    root, ext = os.path.splitext(destination)
+    temp_path = f"{root}.{os.getpid()}.{threading.get_ident()}.part{ext}"
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        if not allow_copy:
+            return False
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
+    return True
+
+
+class SegmentCache:
+    """Finished segments stored by key, with least-recently-used eviction above max_bytes."""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = None  # Size of the stored segments, counted on the first store and kept up to date after it
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key, extension=".mp4"):
+        return os.path.join(self.root, key[:2], key + extension)
+
+    def fetch(self, key, output_file):
+        """Place the cached segment at output_file; return False if it is not in the cache."""
+        cached = self.path(key, os.path.splitext(output_file)[1])
+        try:
+            # The modification time doubles as the last use for eviction
+            os.utime(cached)
+            _link_or_copy(cached, output_file)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, key, output_file):
+        """Add a finished segment to the cache, evicting the least recently used ones if that puts it over budget.
+
+        The segment is hard-linked into the cache. When the cache is on another
+        file system it is not stored: copying every segment a second time would
+        cost as much disk traffic as writing it.
+        """
+        cached = self.path(key, os.path.splitext(output_file)[1])
+        if os.path.exists(cached):
+            os.utime(cached)  # Already stored (a cache hit, or the same cut twice in one job)
+            return
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._entries())
+            if not _link_or_copy(output_file, cached, allow_copy=False):
+                return
+            self._bytes += os.path.getsize(cached)
+            over = self._bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        """Return (last use, size, path) of every stored segment."""
+        entries = []
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if ".part." not in entry.name:
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Delete the least recently used segments until the cache is within max_bytes."""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+            # Other processes may share the cache, so the scan is the true figure
+            self._bytes = total
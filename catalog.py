@@ -0,0 +1,212 @@
+import bisect
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from resources import run_capture
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.expanduser("~"), ".segmentcutter", "catalog.sqlite3")
+
+# ffprobe only reads headers and the packet index, a file that takes longer is treated as unreadable
+PROBE_TIMEOUT = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    format_name TEXT,
+    video_codec TEXT,
+    audio_codec TEXT,
+    width INTEGER,
+    height INTEGER,
+    streams TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS keyframes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    times BLOB NOT NULL
+);
+"""
+
+
+def probe_media(input_file, usage=None, track=None):
+    """Run ffprobe once and return the fields the cutter needs (usage, if given, gets ffprobe's rusage).
+
+    track is passed on to run_capture.
+    """
+    command = ["ffprobe", "-v", "error", "-show_entries",
+               "format=duration,format_name:"
+               "stream=index,codec_type,codec_name,profile,pix_fmt,width,height,r_frame_rate,"
+               "channels,channel_layout,sample_rate,bit_rate",
+               "-of", "json", input_file]
+    probe = json.loads(run_capture(command, usage, PROBE_TIMEOUT, track))
+    streams = probe.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    fmt = probe.get("format", {})
+    return {
+        "duration": float(fmt["duration"]) if fmt.get("duration") not in (None, "N/A") else None,
+        "format_name": fmt.get("format_name"),
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "streams": streams,
+    }
+
+
+def probe_keyframes(input_file, usage=None, track=None):
+    """Read the packet index of the first video stream and return keyframe times as an array of seconds."""
+    # Packets are read without decoding, so this is a single fast pass over the container
+    command = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+               "-show_entries", "packet=pts_time,flags:format=start_time", "-of", "compact", input_file]
+    output = run_capture(command, usage, PROBE_TIMEOUT, track).decode()
+    offset = 0.0
+    times = array("d")
+    for line in output.splitlines():
+        section, _, rest = line.partition("|")
+        fields = dict(field.split("=", 1) for field in rest.split("|") if "=" in field)
+        if section == "packet" and "K" in fields.get("flags", "") and fields.get("pts_time") not in (None, "N/A"):
+            times.append(float(fields["pts_time"]))
+        elif section == "format" and fields.get("start_time") not in (None, "N/A"):
+            offset = float(fields["start_time"])
+    # -ss is relative to the start of the file, not to the first timestamp
+    return array("d", sorted(t - offset for t in times))
+
+
+def keyframe_at_or_before(keyframes, time_point):
+    """Return the last keyframe at or before time_point (the first keyframe if there is none)."""
+    index = bisect.bisect_right(keyframes, time_point)
+    return keyframes[max(index - 1, 0)]
+
+
+def keyframe_at_or_after(keyframes, time_point):
+    """Return the first keyframe at or after time_point, or None if there is none."""
+    index = bisect.bisect_left(keyframes, time_point)
+    return keyframes[index] if index < len(keyframes) else None
+
+
+class MediaCatalog:
+    """On-disk cache of ffprobe results keyed by path, size and mtime."""
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH, metrics=None):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._memo = {}  # path -> (size, mtime_ns, info), saves a SELECT per segment
+        self._keyframe_memo = {}  # path -> (size, mtime_ns, array of keyframe times)
+        self.metrics = metrics  # Optional metrics.Metrics, times every ffprobe call
+        self.track = None  # Optional run_capture track hook, lets an engine kill running ffprobes on cancel
+
+    def _probe(self, probe, path, kind):
+        if self.metrics is None:
+            return probe(path, track=self.track)
+        self.metrics.increment("probes_total")
+        with self.metrics.stage("probe", path=path, kind=kind, bytes=os.path.getsize(path)) as stage:
+            usage = {}
+            try:
+                return probe(path, usage, self.track)
+            finally:
+                stage.update(usage)
+
+    def _lookup(self, path, size, mtime_ns):
+        memo = self._memo.get(path)
+        if memo and memo[0] == size and memo[1] == mtime_ns:
+            return memo[2]
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT duration, format_name, video_codec, audio_codec, width, height, streams "
+                "FROM media WHERE path = ? AND size = ? AND mtime_ns = ?", (path, size, mtime_ns)).fetchone()
+        if row is None:
+            return None
+        info = {
+            "duration": row[0], "format_name": row[1], "video_codec": row[2], "audio_codec": row[3],
+            "width": row[4], "height": row[5], "streams": json.loads(row[6]),
+        }
+        self._memo[path] = (size, mtime_ns, info)
+        return info
+
+    def _store(self, path, size, mtime_ns, info):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, info["duration"], info["format_name"], info["video_codec"],
+                 info["audio_codec"], info["width"], info["height"], json.dumps(info["streams"])))
+            self._conn.commit()
+        self._memo[path] = (size, mtime_ns, info)
+
+    def get(self, input_file):
+        """Return probe data for a file, running ffprobe only if it is new or has changed."""
+        path = os.path.abspath(input_file)
+        st = os.stat(path)
+        info = self._lookup(path, st.st_size, st.st_mtime_ns)
+        if info is None:
+            info = self._probe(probe_media, path, "media")
+            self._store(path, st.st_size, st.st_mtime_ns, info)
+        return info
+
+    def keyframes(self, input_file):
+        """Return the keyframe index of a file, building it only if it is new or has changed."""
+        path = os.path.abspath(input_file)
+        st = os.stat(path)
+        memo = self._keyframe_memo.get(path)
+        if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns:
+            return memo[2]
+        with self._lock:
+            row = self._conn.execute("SELECT times FROM keyframes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                     (path, st.st_size, st.st_mtime_ns)).fetchone()
+        if row is not None:
+            times = array("d")
+            times.frombytes(row[0])
+        else:
+            times = self._probe(probe_keyframes, path, "keyframes")
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO keyframes VALUES (?, ?, ?, ?)",
+                                   (path, st.st_size, st.st_mtime_ns, times.tobytes()))
+                self._conn.commit()
+        self._keyframe_memo[path] = (st.st_size, st.st_mtime_ns, times)
+        return times
+
+    def _get_with_keyframes(self, input_file):
+        info = self.get(input_file)
+        self.keyframes(input_file)
+        return info
+
+    def refresh(self, input_files, workers=4, keyframes=False, cancelled=None):
+        """Make sure every file is catalogued, probing changed files in parallel.
+
+        Files still waiting when the cancelled event (if given) is set are not probed.
+        """
+        results = {}
+        get = self._get_with_keyframes if keyframes else self.get
+
+        def lookup(input_file):
+            if cancelled is not None and cancelled.is_set():
+                return None
+            return get(input_file)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for input_file, future in [(f, pool.submit(lookup, f)) for f in input_files]:
+                try:
+                    results[input_file] = future.result()
+                except (subprocess.SubprocessError, ValueError, OSError):
+                    results[input_file] = None  # Unreadable files are skipped by the cutter
+        return results
+
+    def duration(self, input_file):
+        """Return the duration of a file in seconds."""
+        return self.get(input_file)["duration"]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,177 @@
+"""Headless entry point: cut segments without starting Tk or pygame.
+
+    python cli.py --input IN --output OUT --duration 10 --count 100 --mode copy --workers 8
+    python cli.py --job job.json
+    python cli.py --input IN --output OUT --duration 10 --count 5 --watch
+    python cli.py --input IN --output OUT --duration 60 --split
+    python cli.py --input IN --output OUT --duration 10 --count 20 --renditions 1080p,720p,360p
+
+Progress is written to stdout as one JSON object per line; "progress" events
+carry the fraction, fps, speed and ETA of each running ffmpeg process and of
+the whole job.
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import sys
+import threading
+
+from cache import DEFAULT_CACHE_BYTES, DEFAULT_CACHE_DIR, SegmentCache
+from catalog import DEFAULT_CATALOG_PATH, MediaCatalog
+from cutting import COPY, DEFAULT_LADDER, FASTSTART, OUTPUT_LAYOUTS, REENCODE, SMART, parse_ladder
+from engine import DEFAULT_STALL_TIMEOUT, SegmentEngine
+from watch import DEFAULT_POLL_SECONDS, DEFAULT_SETTLE_SECONDS
+from metrics import Metrics
+
+JOB_KEYS = ("input", "output", "duration", "count", "mode", "workers", "renditions")
+
+
+def workers_arg(value):
+    if value == "auto":
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected a number or "auto", got {value!r}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cut random video segments without the GUI.")
+    parser.add_argument("--job", help="JSON job file with input, output, duration, count, mode, workers and renditions")
+    parser.add_argument("--input", help="Folder with the source videos")
+    parser.add_argument("--output", help="Folder to write the segments to")
+    parser.add_argument("--duration", type=int, help="Segment duration in seconds")
+    parser.add_argument("--count", type=int, help="Number of segments to create (per new file with --watch)")
+    parser.add_argument("--mode", choices=(REENCODE, COPY, SMART), help=f"Encoding mode (default {REENCODE})")
+    parser.add_argument("--workers", type=workers_arg,
+                        help='Parallel ffmpeg jobs (default half the CPU cores), or "auto" to adapt while running')
+    parser.add_argument("--recursive", action="store_true", help="Also take source videos from subfolders")
+    parser.add_argument("--walkers", type=int, default=1,
+                        help="Folders to read at once during a recursive scan, for slow network shares")
+    parser.add_argument("--sample", type=int,
+                        help="Draw only this many source files at random from the input tree")
+    parser.add_argument("--max-overlap", type=float, default=0.0,
+                        help="Seconds two segments of the same source may overlap (default 0, no overlap)")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG_PATH, help="Media catalog database")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Segment cache folder")
+    parser.add_argument("--cache-size", type=float, default=DEFAULT_CACHE_BYTES / 1024 ** 3,
+                        help="Segment cache budget in GiB, least recently used segments are evicted above it")
+    parser.add_argument("--no-cache", action="store_true", help="Neither use nor fill the segment cache")
+    parser.add_argument("--metrics-events", help="Append per-stage timing events to this JSON-lines file")
+    parser.add_argument("--metrics-prom", help="Keep Prometheus counters and histograms in this text file")
+    parser.add_argument("--benchmark", action="store_true", help="Capture ffmpeg's -benchmark report per segment")
+    parser.add_argument("--timeout", type=float, help="Kill any ffmpeg process that runs longer than this (seconds)")
+    parser.add_argument("--stall-timeout", type=float, default=DEFAULT_STALL_TIMEOUT,
+                        help=f"Kill an ffmpeg process that reports no progress for this long, 0 to never "
+                             f"(default {DEFAULT_STALL_TIMEOUT}s)")
+    parser.add_argument("--layout", choices=OUTPUT_LAYOUTS, default=FASTSTART,
+                        help="Output container layout: " + "; ".join(
+                            f"{name}: {layout['description']} ({'' if layout['streamable'] else 'not '}streamable)"
+                            for name, layout in OUTPUT_LAYOUTS.items()))
+    parser.add_argument("--renditions", nargs="?", const=DEFAULT_LADDER,
+                        help=f"Also write every segment scaled to these heights from a single decode "
+                             f"(default ladder {DEFAULT_LADDER}), re-encode only")
+    parser.add_argument("--chunk-seconds", type=float,
+                        help="Encode segments longer than this as chunks of about this many seconds in parallel, "
+                             "joined without re-encoding (re-encode only)")
+    parser.add_argument("--no-stream-copy", action="store_true",
+                        help="Re-encode every stream in reencode and smart mode, even audio that is already AAC")
+    parser.add_argument("--split", action="store_true",
+                        help="Cut every file into consecutive --duration pieces instead of random segments")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and cut segments from every new video as soon as it is complete")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help=f"With --watch, seconds a file must stop growing before it is cut "
+                             f"(default {DEFAULT_SETTLE_SECONDS:g})")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_SECONDS,
+                        help=f"With --watch, seconds between folder checks where inotify is not available "
+                             f"(default {DEFAULT_POLL_SECONDS:g})")
+    parser.add_argument("--no-inotify", action="store_true",
+                        help="With --watch, always poll, e.g. for network shares written by other machines")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Plan the job again instead of resuming it from the journal in the output folder")
+    args = parser.parse_args(argv)
+
+    if args.job:
+        with open(args.job) as f:
+            job = json.load(f)
+        # Command line values override the job file
+        for key in JOB_KEYS:
+            if getattr(args, key) is None and key in job:
+                setattr(args, key, job[key])
+    if args.mode is None:
+        args.mode = REENCODE
+    required = ("input", "output", "duration") if args.split else ("input", "output", "duration", "count")
+    missing = [key for key in required if getattr(args, key) is None]
+    if missing:
+        parser.error("missing " + ", ".join("--" + key for key in missing))
+    if args.mode not in (REENCODE, COPY, SMART):
+        parser.error(f"unknown mode {args.mode!r}")
+    if args.chunk_seconds is not None and (args.chunk_seconds <= 0 or args.mode != REENCODE):
+        parser.error("--chunk-seconds needs a positive number of seconds and --mode reencode")
+    if args.renditions:
+        if args.mode != REENCODE or args.split:
+            parser.error("--renditions needs --mode reencode and does not work with --split")
+        # A job file may list the rungs instead of giving one string
+        ladder = args.renditions if isinstance(args.renditions, str) else ",".join(map(str, args.renditions))
+        try:
+            args.renditions = parse_ladder(ladder)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+
+# Progress events arrive from several worker threads
+_stdout_lock = threading.Lock()
+
+
+def emit(event):
+    line = json.dumps(event) + "\n"
+    with _stdout_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        emit({"event": "error", "error": "ffmpeg and ffprobe must be in the PATH"})
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+
+    metrics = Metrics(args.metrics_events, args.metrics_prom)
+    catalog = MediaCatalog(args.catalog, metrics)
+    cache = None if args.no_cache else SegmentCache(args.cache_dir, int(args.cache_size * 1024 ** 3))
+    segment_engine = SegmentEngine(catalog, args.workers, args.mode, on_progress=emit, metrics=metrics,
+                                   benchmark=args.benchmark, timeout=args.timeout,
+                                   stall_timeout=args.stall_timeout or None, cache=cache,
+                                   max_overlap=args.max_overlap, recursive=args.recursive,
+                                   scan_walkers=args.walkers, sample_size=args.sample, layout=args.layout,
+                                   renditions=args.renditions, chunk_seconds=args.chunk_seconds,
+                                   stream_copy=not args.no_stream_copy)
+    # Ctrl+C or a service manager's SIGTERM kill the running ffmpeg processes and end the job cleanly
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: segment_engine.cancel())
+    try:
+        if args.split:
+            result = segment_engine.split(args.input, args.output, int(args.duration))
+        elif args.watch:
+            result = segment_engine.watch(args.input, args.output, int(args.duration), int(args.count),
+                                          args.settle, args.poll_interval, use_inotify=not args.no_inotify)
+        else:
+            result = segment_engine.generate(args.input, args.output, int(args.duration), int(args.count),
+                                             resume=not args.fresh)
+    except (ValueError, OSError) as e:
+        emit({"event": "error", "error": str(e)})
+        return 1
+    finally:
+        catalog.close()
+        metrics.close()
+    return 0 if result["created"] == result["total"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
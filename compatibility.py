@@ -0,0 +1,87 @@
+"""Per-stream copy or re-encode decisions, made from the probe data in the catalog.
+
+The re-encode mode targets H.264 video and AAC audio. Video is re-encoded
+whenever a cut has to be frame accurate or scaled, but an audio stream that
+already matches the target is copied: AAC packets are short enough that a
+copied track starts within a few milliseconds of the cut, and copying avoids
+a second generation of lossy encoding.
+"""
+from cutting import COPY, SMART, StreamDecision
+
+ENCODE = "encode"
+
+TARGET_VIDEO_CODEC = "h264"
+TARGET_AUDIO_CODEC = "aac"
+# AAC profiles every MP4, Matroska and MPEG-TS player decodes
+AUDIO_PROFILES = {"LC", "HE-AAC", "HE-AACv2"}
+AUDIO_SAMPLE_RATES = {44100, 48000}
+# Tracks above this are brought down to the 192k target instead of being copied
+MAX_AUDIO_BIT_RATE = 320000
+
+
+def _number(value):
+    """ffprobe numbers are strings, and "N/A" or missing when unknown; return 0 then."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _audio_mismatch(stream):
+    """Return why an audio stream does not match the target, or None if it can be copied."""
+    if stream.get("codec_name") != TARGET_AUDIO_CODEC:
+        return f"{stream.get('codec_name') or 'unknown codec'} is not {TARGET_AUDIO_CODEC}"
+    if stream.get("profile") not in AUDIO_PROFILES:
+        return f"AAC profile {stream.get('profile') or 'unknown'}"
+    if _number(stream.get("sample_rate")) not in AUDIO_SAMPLE_RATES:
+        return f"sample rate {stream.get('sample_rate') or 'unknown'}"
+    if _number(stream.get("bit_rate")) > MAX_AUDIO_BIT_RATE:
+        return f"bit rate {_number(stream['bit_rate']) // 1000}k above {MAX_AUDIO_BIT_RATE // 1000}k"
+    return None  # Matroska often has no per-stream bit rate, that is no reason to re-encode
+
+
+def _video_decision(info, mode, rendition):
+    if mode == COPY:
+        return StreamDecision("video", COPY, "stream copy mode")
+    if rendition is not None:
+        return StreamDecision("video", ENCODE, f"scaled to {rendition.name}")
+    if mode == SMART and info.get("video_codec") == TARGET_VIDEO_CODEC:
+        return StreamDecision("video", SMART, "encoded up to the first keyframe, copied after it")
+    if info.get("video_codec") != TARGET_VIDEO_CODEC:
+        return StreamDecision("video", ENCODE, f"{info.get('video_codec') or 'unknown codec'} is not H.264")
+    return StreamDecision("video", ENCODE, "frame-accurate cut")
+
+
+def analyze_streams(info, mode, rendition=None, allow_copy=True):
+    """Decide how each stream of a catalogued source is written in this mode; return a tuple of StreamDecisions.
+
+    info is a catalog record. With allow_copy False every stream is re-encoded
+    in the re-encode and smart modes, the way the cutter always did.
+    """
+    decisions = []
+    if info.get("video_codec"):
+        decisions.append(_video_decision(info, mode, rendition))
+    audio = [stream for stream in info.get("streams", []) if stream.get("codec_type") == "audio"]
+    if audio:
+        if mode == COPY:
+            decisions.append(StreamDecision("audio", COPY, "stream copy mode"))
+        elif not allow_copy:
+            decisions.append(StreamDecision("audio", ENCODE, "stream copy disabled"))
+        else:
+            # Which track ffmpeg picks is up to its stream selection, so every one has to match
+            mismatch = next(filter(None, map(_audio_mismatch, audio)), None)
+            decisions.append(StreamDecision("audio", ENCODE, mismatch) if mismatch
+                             else StreamDecision("audio", COPY, "already AAC at an acceptable profile and rate"))
+    return tuple(decisions)
+
+
+def describe(decisions):
+    """Return the decisions as {"video": {"action": ..., "reason": ...}, ...} for events and the journal."""
+    return {decision.stream: {"action": decision.action, "reason": decision.reason} for decision in decisions or ()}
+
+
+def from_description(description):
+    """Inverse of describe()."""
+    return tuple(StreamDecision(stream, fields["action"], fields["reason"])
+                 for stream, fields in (description or {}).items())
+
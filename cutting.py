@@ -0,0 +1,446 @@
+import math
+import os
+import subprocess
+import tempfile
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+from catalog import keyframe_at_or_after
+
+REENCODE = "reencode"
+COPY = "copy"
+SMART = "smart"
+
+# Label shown in the GUI -> mode name
+ENCODING_MODES = {
+    "Re-encode (frame accurate)": REENCODE,
+    "Fast / lossless (stream copy)": COPY,
+    "Smart render (encode to first keyframe)": SMART,
+}
+
+# A segment to cut, decided up front so segments can be grouped by source; rendition is None for the source size,
+# streams holds the StreamDecisions of compatibility.analyze_streams (None re-encodes every stream)
+PlannedSegment = namedtuple("PlannedSegment",
+                            ["input_file", "start_time", "duration", "output_file", "rendition", "streams"],
+                            defaults=[None, None])
+
+# Whether one stream ("video" or "audio") of a segment is copied or encoded, and why
+StreamDecision = namedtuple("StreamDecision", ["stream", "action", "reason"])
+
+# One rung of a rendition ladder: every cut is also encoded scaled down to this height
+Rendition = namedtuple("Rendition", ["name", "height"])
+DEFAULT_LADDER = "1080p,720p,360p"
+
+# Output layouts: how the container is written and whether playback can start before the file is complete
+FASTSTART = "faststart"
+FRAGMENTED = "fragmented"
+RESERVED_MOOV = "reserved"
+PLAIN = "plain"
+MATROSKA = "mkv"
+MPEGTS = "ts"
+
+OUTPUT_LAYOUTS = {
+    FASTSTART: {"extension": ".mp4", "format": "mp4", "streamable": True, "passes": 2,
+                "description": "MP4, index moved to the front by reading and rewriting the whole file"},
+    FRAGMENTED: {"extension": ".mp4", "format": "mp4", "streamable": True, "passes": 1,
+                 "description": "Fragmented MP4, a small index up front and one fragment per keyframe"},
+    RESERVED_MOOV: {"extension": ".mp4", "format": "mp4", "streamable": True, "passes": 1,
+                    "description": "MP4 with space for the index reserved at the front, filled in at the end"},
+    PLAIN: {"extension": ".mp4", "format": "mp4", "streamable": False, "passes": 1,
+            "description": "MP4 with the index at the end, players must fetch the end first"},
+    MATROSKA: {"extension": ".mkv", "format": "matroska", "streamable": True, "passes": 1,
+               "description": "Matroska, plays while downloading, the seek index is at the end"},
+    MPEGTS: {"extension": ".ts", "format": "mpegts", "streamable": True, "passes": 1,
+             "description": "MPEG-TS, no index at all, made for streaming"},
+}
+
+# Index bytes to reserve per second of media for RESERVED_MOOV, about 3x a 60 fps stream with audio
+MOOV_BYTES_PER_SECOND = 4096
+MOOV_BYTES_MIN = 64 * 1024
+
+
+def muxer_options(layout, duration=None):
+    """Return the muxer options of an output layout as a dict, sized for duration seconds of media."""
+    if layout == FASTSTART:
+        return {"movflags": "+faststart"}  # Allow for quicker playback
+    if layout == FRAGMENTED:
+        return {"movflags": "+frag_keyframe+empty_moov+default_base_moof"}
+    if layout == RESERVED_MOOV:
+        # Too little space makes ffmpeg fail at the end, so err on the large side
+        return {"moov_size": str(MOOV_BYTES_MIN + int(MOOV_BYTES_PER_SECOND * (duration or 600)))}
+    if layout in OUTPUT_LAYOUTS:
+        return {}
+    raise ValueError(f"Unknown output layout: {layout!r}")
+
+
+def layout_args(layout, duration=None):
+    """Return the per-output command-line options of an output layout."""
+    return [arg for option, value in muxer_options(layout, duration).items() for arg in ("-" + option, value)]
+
+
+# Upper bound on outputs per batched ffmpeg process, each output carries its own encoder
+MAX_OUTPUTS_PER_PROCESS = 8
+
+# Nudge past a keyframe when seeking to it, so float rounding never lands on the previous one
+KEYFRAME_EPSILON = 0.001
+
+
+def parse_ladder(text):
+    """Parse a rendition ladder such as "1080p,720p,360p" into Renditions, largest first."""
+    renditions = {}
+    for rung in text.split(","):
+        rung = rung.strip().lower()
+        height = rung[:-1] if rung.endswith("p") else rung
+        if not height.isdigit() or int(height) < 2 or int(height) % 2:
+            raise ValueError(f"Invalid rendition {rung!r}, expected an even height such as 720p")
+        renditions[int(height)] = Rendition(f"{int(height)}p", int(height))
+    return sorted(renditions.values(), key=lambda rendition: -rendition.height)
+
+
+def scale_filter(rendition):
+    """Scale to the rendition's height keeping the aspect ratio, never upscaling a smaller source."""
+    # The quotes keep the comma inside min() from ending the filter
+    return f"scale=-2:'min({rendition.height},ih)'"
+
+
+def thread_args(threads):
+    """Encoder thread count for one output, empty to let ffmpeg decide."""
+    return ["-threads", str(threads)] if threads else []
+
+
+def copies_audio(streams):
+    """True when the stream decisions of a segment copy its audio."""
+    return any(decision.stream == "audio" and decision.action == COPY for decision in streams or ())
+
+
+def audio_args(copy_audio=False):
+    """Audio options of the re-encode target, or a plain copy of an audio stream that already matches it."""
+    if copy_audio:
+        return ["-c:a", "copy"]
+    return [
+        "-c:a", "aac",  # Audio codec
+        "-b:a", "192k",  # Audio bitrate
+    ]
+
+
+def codec_args(mode, threads=None, copy_audio=False, input_index=0):
+    """Return the per-output codec options for an encoding mode; copy_audio keeps the audio as it is.
+
+    Stream copy maps its streams from the input numbered input_index.
+    """
+    if mode == COPY:
+        return [
+            "-map", f"{input_index}:v:0", "-map", f"{input_index}:a?",  # Keep the main video and all audio streams
+            "-c", "copy",  # No re-encoding, the cut starts on the keyframe at or before start_time
+            "-avoid_negative_ts", "make_zero",  # Shift timestamps so the segment starts at zero
+        ]
+    if mode in (REENCODE, SMART):
+        # Smart render encodes with the same settings, up to the first keyframe
+        return [
+            "-c:v", "libx264",  # Video codec (H.264)
+            "-preset", "medium",  # Encoding speed
+            "-crf", "23",  # Constant Rate Factor for quality (lower is better)
+        ] + audio_args(copy_audio) + thread_args(threads)
+    raise ValueError(f"Unknown encoding mode: {mode!r}")
+
+
+def build_cut_command(input_file, output_file, start_time, duration, mode=REENCODE, threads=None, layout=FASTSTART,
+                      rendition=None, copy_audio=False):
+    """Build the FFmpeg command that cuts one segment, scaled down to rendition if given."""
+    command = [
+        "ffmpeg",
+        "-ss", str(start_time),  # Seek to the start time
+        "-i", input_file,  # Input file
+        "-t", str(duration),  # Duration of the segment
+    ]
+    if rendition is not None:
+        command += ["-vf", scale_filter(rendition)]
+    command += codec_args(mode, threads, copy_audio)
+    command += layout_args(layout, duration)
+    command += [
+        output_file
+    ]
+    return command
+
+
+def group_by_source(segments, max_outputs=MAX_OUTPUTS_PER_PROCESS):
+    """Group planned segments by source file into batches for build_batch_command.
+
+    The renditions of one cut always share a batch, so the cut is decoded once
+    even when that takes the batch past max_outputs.
+    """
+    by_source = defaultdict(list)
+    for segment in segments:
+        by_source[segment.input_file].append(segment)
+    batches = []
+    for source_segments in by_source.values():
+        source_segments.sort(key=lambda segment: (segment.start_time, segment.duration))
+        batch = []
+        for _, cut in groupby(source_segments, key=lambda segment: (segment.start_time, segment.duration)):
+            cut = list(cut)
+            if batch and len(batch) + len(cut) > max_outputs:
+                batches.append(batch)
+                batch = []
+            batch += cut
+        if batch:
+            batches.append(batch)
+    return batches
+
+
+def rendition_graph(segments, inputs):
+    """Return the -filter_complex graph that scales the decoded video of each cut once per rendition, and the
+    label each segment maps, in order. inputs holds the index of the input each segment is cut from."""
+    by_input = defaultdict(list)
+    for index, input_index in enumerate(inputs):
+        by_input[input_index].append(index)
+    chains = []
+    labels = [None] * len(segments)
+    for input_index, indexes in by_input.items():
+        sources = [f"[{input_index}:v:0]"]
+        if len(indexes) > 1:
+            # One decode of the cut, fanned out to a scaler per rendition
+            sources = [f"[c{input_index}_{n}]" for n in range(len(indexes))]
+            chains.append(f"[{input_index}:v:0]split={len(indexes)}" + "".join(sources))
+        for source, index in zip(sources, indexes):
+            rendition = segments[index].rendition
+            labels[index] = f"[o{index}]"
+            chains.append(source + (scale_filter(rendition) if rendition else "null") + labels[index])
+    return ";".join(chains), labels
+
+
+def build_batch_command(segments, mode=REENCODE, threads=None, layout=FASTSTART):
+    """Build one FFmpeg command that cuts several segments of the same source file.
+
+    Every cut gets an input of its own, sought straight to its start, so nothing
+    between the segments is read or decoded and stream copy starts each output
+    on its own keyframe. What is shared is the process, the encoder setup and
+    the renditions of a cut: they are scaled from a single decode through a
+    filter graph. threads is the encoder budget of the whole process and is
+    shared out among its outputs.
+    """
+    command = [
+        "ffmpeg",
+    ]
+    if threads and mode != COPY:
+        # Every output runs an encoder of its own, together they get the threads of one job
+        threads = max(1, threads // len(segments))
+    inputs = []
+    cuts = {}  # (start, duration) -> input index
+    for segment in segments:
+        cut = (segment.start_time, segment.duration)
+        if cut not in cuts:
+            cuts[cut] = len(cuts)
+            command += [
+                "-ss", str(segment.start_time),  # Seek this input to the segment's start
+                "-i", segment.input_file,
+            ]
+        inputs.append(cuts[cut])
+    labels = [None] * len(segments)
+    if any(segment.rendition for segment in segments):
+        graph, labels = rendition_graph(segments, inputs)
+        command += ["-filter_complex", graph]
+    for segment, input_index, label in zip(segments, inputs, labels):
+        command += [
+            "-t", str(segment.duration),
+        ]
+        if label:
+            command += ["-map", label, "-map", f"{input_index}:a?"]  # Scaled video, audio straight from the input
+        elif mode != COPY:
+            command += ["-map", f"{input_index}:v:0", "-map", f"{input_index}:a?"]
+        command += codec_args(mode, threads, copies_audio(segment.streams), input_index)
+        command += layout_args(layout, segment.duration)
+        command += [
+            segment.output_file
+        ]
+    return command
+
+
+def build_split_command(input_file, output_pattern, list_file, segment_seconds, mode=REENCODE, threads=None,
+                        layout=FASTSTART, copy_audio=False):
+    """Build one FFmpeg command that cuts a whole file into consecutive segment_seconds pieces.
+
+    output_pattern holds a printf-style counter (segment_%04d.mp4); the finished pieces
+    are written to list_file as csv lines of name, start and end. Stream copy can only cut
+    on keyframes, so its pieces start at the first keyframe after each boundary.
+    Smart render has nothing to gain here and re-encodes.
+    """
+    command = [
+        "ffmpeg",
+        "-i", input_file,
+    ]
+    if mode == COPY:
+        command += codec_args(COPY)
+    else:
+        command += codec_args(REENCODE, threads, copy_audio)
+        # One continuous encode with a keyframe on every boundary, so each piece is exactly segment_seconds
+        command += ["-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})"]
+    command += [
+        "-f", "segment",  # Segment muxer: a new file every segment_seconds
+        "-segment_time", str(segment_seconds),
+        "-segment_time_delta", "0.05",  # Tolerate the forced keyframes landing a little before the boundary
+        "-reset_timestamps", "1",  # Every piece starts at zero
+        "-segment_format", OUTPUT_LAYOUTS[layout]["format"],
+    ]
+    options = muxer_options(layout, segment_seconds)
+    if options:
+        command += ["-segment_format_options", ":".join(f"{option}={value}" for option, value in options.items())]
+    command += [
+        "-segment_list", list_file,
+        "-segment_list_type", "csv",  # Start and end of every piece, to find the slivers left at the end
+        output_pattern
+    ]
+    return command
+
+
+def run_command(command, seconds=None):
+    """Run an FFmpeg command, raising CalledProcessError if it fails.
+
+    seconds is what run_chunked_cut passes to a run function of its caller, for progress; unused here.
+    """
+    subprocess.run(command, check=True)
+
+
+def run_smart_cut(input_file, output_file, start_time, duration, keyframes, video_codec=None, run=run_command,
+                  threads=None, layout=FASTSTART, copy_audio=False):
+    """Cut a frame-accurate segment, re-encoding only the frames before the first keyframe.
+
+    The head (start_time up to the next keyframe) is encoded with libx264, the
+    remaining GOPs are stream copied, and the two parts are joined with the
+    concat demuxer. Audio is re-encoded (or, with copy_audio, copied) over the whole range. Falls back to a
+    full re-encode when the source is not H.264 or no keyframe falls inside
+    the segment. Every ffmpeg process is started through run.
+    """
+    end_time = start_time + duration
+    keyframe = keyframe_at_or_after(keyframes, start_time) if keyframes else None
+    if video_codec != "h264" or keyframe is None or keyframe >= end_time:
+        run(build_cut_command(input_file, output_file, start_time, duration, REENCODE, threads, layout,
+                              copy_audio=copy_audio))
+        return output_file
+    if keyframe - start_time < KEYFRAME_EPSILON:
+        # Already on a keyframe, nothing to re-encode
+        start_time = keyframe
+
+    with tempfile.TemporaryDirectory(prefix="smartcut_") as work_dir:
+        parts = []
+        if keyframe > start_time:
+            head = os.path.join(work_dir, "head.ts")
+            run([
+                "ffmpeg", "-v", "error",
+                "-ss", str(start_time), "-i", input_file, "-t", str(keyframe - start_time),
+                "-map", "0:v:0", "-an",
+                "-c:v", "libx264", "-preset", "medium", "-crf", "23",
+                *thread_args(threads),
+                head
+            ])
+            parts.append(head)
+        tail = os.path.join(work_dir, "tail.ts")
+        run([
+            "ffmpeg", "-v", "error",
+            "-ss", str(keyframe + KEYFRAME_EPSILON), "-i", input_file, "-t", str(end_time - keyframe),
+            "-map", "0:v:0", "-an",
+            "-c", "copy",
+            tail
+        ])
+        parts.append(tail)
+
+        # MPEG-TS parts carry their parameter sets in-band, so the concat demuxer can join them safely
+        concat_list = os.path.join(work_dir, "parts.txt")
+        with open(concat_list, "w") as f:
+            f.writelines(f"file '{part}'\n" for part in parts)
+        run([
+            "ffmpeg",
+            "-f", "concat", "-safe", "0", "-i", concat_list,
+            "-ss", str(start_time), "-i", input_file, "-t", str(duration),
+            "-map", "0:v:0", "-map", "1:a?",
+            "-c:v", "copy",
+            *audio_args(copy_audio),
+            *layout_args(layout, duration),
+            output_file
+        ])
+    return output_file
+
+
+def chunk_boundaries(start_time, duration, chunk_seconds, keyframes=None):
+    """Return the start times of the chunks of a long cut, each moved onto the next source keyframe when known.
+
+    Starting a chunk on a keyframe means its decode starts right there and its
+    first frame is exactly the one after the previous chunk's last.
+    """
+    end_time = start_time + duration
+    boundaries = [start_time]
+    for i in range(1, math.ceil(duration / chunk_seconds)):
+        boundary = start_time + i * chunk_seconds
+        if keyframes:
+            boundary = keyframe_at_or_after(keyframes, boundary)
+            if boundary is None:
+                break
+        if boundary - boundaries[-1] >= KEYFRAME_EPSILON and end_time - boundary >= KEYFRAME_EPSILON:
+            boundaries.append(boundary)
+    return boundaries
+
+
+def run_chunked_cut(input_file, output_file, start_time, duration, chunk_seconds, keyframes=None, run=run_command,
+                    pool=None, threads=None, layout=FASTSTART, rendition=None, copy_audio=False):
+    """Re-encode a long segment as chunks in parallel and join them without re-encoding.
+
+    The video is cut at chunk_boundaries, every chunk is encoded by its own
+    ffmpeg process on pool (an Executor shared with other segments; a pool of
+    its own running every chunk at once by default), and the chunks are joined
+    with the concat demuxer while the audio is encoded (or copied) in one pass
+    over the whole range, so there are no gaps at the joins. Every ffmpeg
+    process is started through run, from several threads at once, as
+    run(command, seconds) with the seconds of the segment it encodes (0 for
+    the join, which only encodes audio).
+    """
+    boundaries = chunk_boundaries(start_time, duration, chunk_seconds, keyframes)
+    if len(boundaries) < 2:
+        run(build_cut_command(input_file, output_file, start_time, duration, REENCODE, threads, layout, rendition,
+                              copy_audio), duration)
+        return output_file
+
+    with tempfile.TemporaryDirectory(prefix="chunks_") as work_dir:
+        chunks = []
+        commands = []
+        lengths = [end - start for start, end in zip(boundaries, boundaries[1:] + [start_time + duration])]
+        for i, chunk_start in enumerate(boundaries):
+            chunk = os.path.join(work_dir, f"chunk_{i:04d}.mp4")
+            chunks.append(chunk)
+            filters = [scale_filter(rendition)] if rendition else []
+            if i + 1 < len(boundaries):
+                # -t counts from the first frame kept, which for the first chunk can be a little after
+                # chunk_start; trim counts from the seek point, so the boundary frame goes to the next chunk only
+                filters.insert(0, f"trim=end={boundaries[i + 1] - chunk_start - KEYFRAME_EPSILON}")
+                limit = []
+            else:
+                # The last chunk ends the way a single encode of the whole segment would
+                limit = ["-t", str(start_time + duration - chunk_start)]
+            commands.append([
+                "ffmpeg", "-v", "error",
+                "-ss", str(chunk_start), "-i", input_file, *limit,
+                "-map", "0:v:0", "-an",
+                *(["-vf", ",".join(filters)] if filters else []),
+                *codec_args(REENCODE, threads),
+                chunk
+            ])
+        if pool is None:
+            with ThreadPoolExecutor(max_workers=len(commands)) as own_pool:
+                # list() waits for every chunk and raises the first failure
+                list(own_pool.map(run, commands, lengths))
+        else:
+            list(pool.map(run, commands, lengths))
+
+        concat_list = os.path.join(work_dir, "chunks.txt")
+        with open(concat_list, "w") as f:
+            f.writelines(f"file '{chunk}'\n" for chunk in chunks)
+        run([
+            "ffmpeg",
+            "-f", "concat", "-safe", "0", "-i", concat_list,
+            "-ss", str(start_time), "-i", input_file, "-t", str(duration),
+            "-map", "0:v:0", "-map", "1:a?",
+            "-c:v", "copy",
+            *audio_args(copy_audio),
+            *layout_args(layout, duration),
+            output_file
+        ], 0)
+    return output_file
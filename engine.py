@@ -0,0 +1,791 @@
+"""Segment cutting engine shared by the GUI, the command line and other Python code.
+
+    from engine import SegmentEngine
+
+    segment_engine = SegmentEngine(workers=8, mode="copy", on_progress=print)
+    files = segment_engine.scan("videos")
+    segments = segment_engine.plan(files, "segments", duration=10, total_segments=100)
+    segment_engine.run(segments)  # segment_engine.cancel() from another thread stops it
+
+Only the standard library is imported and no process is started until scan() or run().
+"""
+import collections
+import contextlib
+import csv
+import functools
+import hashlib
+import itertools
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache import part_path, segment_key
+from catalog import MediaCatalog
+from compatibility import analyze_streams, describe
+from cutting import (COPY, FASTSTART, MAX_OUTPUTS_PER_PROCESS, OUTPUT_LAYOUTS, REENCODE, SMART, PlannedSegment,
+                     build_batch_command, build_cut_command, build_split_command, copies_audio, group_by_source,
+                     run_chunked_cut, run_smart_cut)
+from journal import JobJournal
+from metrics import Metrics
+from planner import plan_starts
+from progress import ProgressParser, with_progress
+from resources import add_to_summary, new_summary, parse_benchmark, wait
+from scanner import iter_videos, reservoir_sample
+from scheduler import AdaptiveScheduler
+from watch import (DEFAULT_POLL_SECONDS, DEFAULT_SETTLE_SECONDS, WATCH_STATE_NAME, FolderWatcher,
+                   append_watch_state, load_watch_state)
+
+
+def default_worker_count():
+    """Number of ffmpeg jobs to run at once by default."""
+    # libx264 already uses several threads per encode, so one job per core would oversubscribe the CPU
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+def list_videos(folder):
+    """List all video files in the input folder."""
+    return [os.path.basename(path) for path in iter_videos(folder)]
+
+
+# Kill an ffmpeg process that has not reported progress for this long (seconds)
+DEFAULT_STALL_TIMEOUT = 300
+# How often the watchdog looks at the running processes, also bounds how late a kill can be
+WATCHDOG_INTERVAL = 0.25
+# Longest wait for file system changes in watch mode, also bounds how late cancel() is noticed there
+WATCH_POLL_TIMEOUT = 0.5
+# A split piece shorter than this is the sliver left over at the end of a source and is dropped
+MIN_PIECE_SECONDS = 0.1
+
+
+class CancelledError(Exception):
+    """Raised inside a worker when the job was cancelled."""
+
+
+class ProcessTimeout(Exception):
+    """Raised inside a worker when the watchdog killed its ffmpeg process."""
+
+
+def _hooks_catalog(method):
+    """Hook the catalog's ffprobe calls to the engine while the method runs.
+
+    The processes are registered so cancel() kills them, and a catalog without
+    metrics of its own counts its probes in the engine's. One catalog can outlive
+    the engine (the GUI keeps one for every job), so its hooks are put back after.
+    """
+    @functools.wraps(method)
+    def hooked(self, *args, **kwargs):
+        with self._hook_lock:
+            if not self._hook_users:
+                catalog = self.catalog
+                self._saved_hooks = catalog.track, catalog.metrics
+                catalog.track = self._track_probe
+                catalog.metrics = catalog.metrics or self.metrics
+            self._hook_users += 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            with self._hook_lock:
+                self._hook_users -= 1
+                if not self._hook_users:
+                    self.catalog.track, self.catalog.metrics = self._saved_hooks
+    return hooked
+
+
+class SegmentEngine:
+    """Scan, plan and cut random segments without any GUI or audio dependency.
+
+    Nothing is probed or spawned until scan() or run() is called, so creating
+    an engine (or importing this module) is cheap.
+    """
+
+    def __init__(self, catalog=None, workers=None, mode=REENCODE, on_progress=None, metrics=None,
+                 benchmark=False, timeout=None, stall_timeout=DEFAULT_STALL_TIMEOUT, cache=None, max_overlap=0.0,
+                 recursive=False, scan_walkers=1, sample_size=None, layout=FASTSTART, renditions=None,
+                 chunk_seconds=None, stream_copy=True):
+        self.metrics = metrics or Metrics()
+        self.benchmark = benchmark  # Also capture ffmpeg's own -benchmark report
+        self._catalog = catalog
+        # workers="auto" lets the scheduler pick the number of jobs and encoder threads while running
+        self.scheduler = AdaptiveScheduler() if workers == "auto" else None
+        self.workers = self.scheduler.max_jobs if self.scheduler else workers or default_worker_count()
+        self.mode = mode
+        self.layout = layout  # Container layout of the outputs, see cutting.OUTPUT_LAYOUTS
+        if renditions and mode != REENCODE:
+            raise ValueError("Rendition ladders need the re-encode mode.")
+        # Rendition ladder, each cut is written once per Rendition from a single decode; None for the source size
+        self.renditions = list(renditions) if renditions else None
+        if chunk_seconds and mode != REENCODE:
+            raise ValueError("Chunked encoding needs the re-encode mode.")
+        # Segments longer than this are encoded as chunks of about this length in parallel, None disables it
+        self.chunk_seconds = chunk_seconds
+        # Copy source streams that already match the re-encode target (AAC audio) instead of encoding them again
+        self.stream_copy = stream_copy
+        self.on_progress = on_progress
+        self.cache = cache  # SegmentCache serving cuts that were made before, optional
+        self.max_overlap = max_overlap  # Seconds two planned segments of a source may share
+        # Source discovery: include subfolders, read this many folders at once, draw only this many sources
+        self.recursive = recursive
+        self.scan_walkers = scan_walkers
+        self.sample_size = sample_size
+        # Per-process limits enforced by the watchdog thread, None disables them
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self._cancelled = threading.Event()
+        self._processes = {}  # Popen -> {"started", "last_output", "killed"}
+        self._probes = set()  # Running ffprobe processes, killed by cancel() but left alone by the watchdog
+        self._processes_lock = threading.Lock()
+        # Live progress of the batches in flight, for the aggregate figures
+        self._stats_lock = threading.Lock()
+        self._active = {}  # batch id -> (fraction, fps, segments)
+        self._finished_segments = 0
+        self._total_segments = 0
+        self._started = None
+        # CPU time and peak memory of the ffmpeg children, per batch and for the whole job
+        self._batch_usage = {}
+        self._job_usage = new_summary()
+        # Jobs currently running, capped by the scheduler's job count in adaptive mode
+        self._slots = threading.Condition()
+        self._running_jobs = 0
+        # Chunks of long segments, shared by every worker so they never run more than workers encodes
+        self._chunk_pool = None
+        self._chunk_pool_lock = threading.Lock()
+        # Calls in progress that hook the catalog's probes to this engine, and the hooks it had before them
+        self._hook_lock = threading.Lock()
+        self._hook_users = 0
+        self._saved_hooks = None
+
+    @property
+    def catalog(self):
+        # Opened on first use, so an engine that is never run does not touch the disk
+        if self._catalog is None:
+            self._catalog = MediaCatalog(metrics=self.metrics)
+        return self._catalog
+
+    def _emit(self, event, **fields):
+        fields = {"event": event, **fields}
+        if self.on_progress:
+            self.on_progress(fields)
+        return fields
+
+    def _report(self, batch_id, segments, snapshot):
+        """Emit a "progress" event for one ffmpeg process together with the aggregate for the whole job."""
+        with self._stats_lock:
+            previous = self._active.get(batch_id, (0.0, 0.0, segments))[0]
+            # Smart render runs several processes per segment, never let the bar move backwards
+            fraction = max(previous, snapshot["fraction"] or 0.0)
+            self._active[batch_id] = (fraction, snapshot["fps"], segments)
+            in_flight = sum(f * n for f, _, n in self._active.values())
+            fps_total = sum(fps for _, fps, _ in self._active.values())
+            overall = (self._finished_segments + in_flight) / self._total_segments if self._total_segments else 0.0
+        # cut_batch() and cut_segment() can be called without run(), then there is no job clock
+        elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+        self._emit("progress", batch=batch_id, fraction=fraction, fps=snapshot["fps"], speed=snapshot["speed"],
+                   eta=snapshot["eta"], overall=overall, fps_total=fps_total,
+                   eta_total=elapsed * (1 - overall) / overall if overall and elapsed else None)
+
+    def _drain_stderr(self, stream, benchmark):
+        """Forward ffmpeg's log to our stderr, keeping the -benchmark lines for the result record."""
+        with stream:
+            for line in stream:
+                if not parse_benchmark(line, benchmark):
+                    sys.stderr.write(line)
+
+    def _run(self, command, batch_id=None, segments=1, expected_seconds=None, report=None):
+        """Run an ffmpeg command, reporting its progress and killing it if the job is cancelled.
+
+        report, if given, is called with every progress snapshot instead of reporting it for batch_id directly.
+        """
+        if self._cancelled.is_set():
+            raise CancelledError()
+        parser = ProgressParser(expected_seconds)
+        command = with_progress(command)
+        benchmark = {}
+        if self.benchmark:
+            command = command[:1] + ["-benchmark"] + command[1:]
+        started = last_progress = time.perf_counter()
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE if self.benchmark else None, text=True)
+        stderr_thread = None
+        if self.benchmark:
+            stderr_thread = threading.Thread(target=self._drain_stderr, args=(process.stderr, benchmark))
+            stderr_thread.start()
+        watch = {"started": time.monotonic(), "last_output": time.monotonic(), "killed": None}
+        with self._processes_lock:
+            self._processes[process] = watch
+            if self._cancelled.is_set():
+                process.kill()  # cancel() ran between the check above and the registration
+        try:
+            for line in process.stdout:
+                watch["last_output"] = time.monotonic()
+                snapshot = parser.feed(line)
+                if snapshot and not snapshot["finished"]:
+                    last_progress = time.perf_counter()
+                if snapshot and report is not None:
+                    report(snapshot)
+                elif snapshot and batch_id is not None:
+                    self._report(batch_id, segments, snapshot)
+            returncode, usage = wait(process)
+        finally:
+            process.stdout.close()
+            if stderr_thread:
+                stderr_thread.join()
+            with self._processes_lock:
+                self._processes.pop(process, None)
+        ended = time.perf_counter()
+        with self._stats_lock:
+            add_to_summary(self._job_usage, usage, returncode)
+            record = self._batch_usage.setdefault(batch_id, new_summary())
+            add_to_summary(record, usage, returncode)
+            if benchmark:
+                record.setdefault("benchmark", []).append(benchmark)
+        if self._cancelled.is_set():
+            raise CancelledError()
+        if watch["killed"]:
+            raise ProcessTimeout(f"{watch['killed']}: {subprocess.list2cmdline(command)}")
+        # Whatever runs after the last progress block (flushing, trailer, the +faststart rewrite) is finalize
+        fields = {"batch": batch_id, "segments": segments, "returncode": returncode, **(usage or {})}
+        self.metrics.observe("encode", last_progress - started, **fields)
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, command)
+        self.metrics.observe("finalize", ended - last_progress, **fields)
+
+    def _watchdog(self, stop):
+        """Kill ffmpeg processes that run past the timeout or stop reporting progress."""
+        while not stop.wait(WATCHDOG_INTERVAL):
+            now = time.monotonic()
+            with self._processes_lock:
+                for process, watch in self._processes.items():
+                    if watch["killed"]:
+                        continue
+                    if self.timeout and now - watch["started"] > self.timeout:
+                        watch["killed"] = f"timed out after {self.timeout}s"
+                    elif self.stall_timeout and now - watch["last_output"] > self.stall_timeout:
+                        watch["killed"] = f"no progress for {self.stall_timeout}s"
+                    else:
+                        continue
+                    process.kill()
+
+    @contextlib.contextmanager
+    def _track_probe(self, process):
+        """Register a running ffprobe with the engine until it exits, so cancel() kills it too."""
+        with self._processes_lock:
+            self._probes.add(process)
+            if self._cancelled.is_set():
+                process.kill()  # cancel() ran before the probe was registered
+        try:
+            yield process
+        finally:
+            with self._processes_lock:
+                self._probes.discard(process)
+
+    def cancel(self):
+        """Stop the running job: pending segments are dropped and running ffmpeg and ffprobe processes are killed."""
+        self._cancelled.set()
+        with self._processes_lock:
+            for process in itertools.chain(self._processes, self._probes):
+                process.kill()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @_hooks_catalog
+    def scan(self, input_folder, exclude=()):
+        """List the videos of a folder and make sure they are all in the catalog.
+
+        With sample_size set, that many sources are drawn uniformly while the tree
+        is read, so only they are kept in memory and probed.
+        """
+        with self.metrics.stage("scan", folder=input_folder) as stage:
+            videos = iter_videos(input_folder, self.recursive, self.scan_walkers, exclude)
+            input_files = reservoir_sample(videos, self.sample_size) if self.sample_size else list(videos)
+            stage["files"] = len(input_files)
+        # Only new or changed files are probed, the rest come straight from the catalog
+        self.catalog.refresh(input_files, self.workers, keyframes=self._wants_keyframes, cancelled=self._cancelled)
+        return input_files
+
+    @property
+    def _wants_keyframes(self):
+        # Stream copy and smart render cut on keyframes, chunked encoding starts its chunks on them
+        return self.mode in (COPY, SMART) or bool(self.chunk_seconds)
+
+    def _chunked(self, segment):
+        return bool(self.chunk_seconds) and segment.duration > self.chunk_seconds
+
+    @_hooks_catalog
+    def planned_segment(self, input_file, start_time, duration, output_folder, rendition=None):
+        """Plan a cut, named after its cache key so the same cut always gets the same file name."""
+        # Rounded up, so a start on a keyframe stays at or after it and stream copy still starts there
+        start_time = math.ceil(start_time * 1000) / 1000
+        key = segment_key(input_file, start_time, duration, self.mode, self.layout)
+        extension = OUTPUT_LAYOUTS[self.layout]["extension"]
+        # The renditions of a cut share the cut's name, so they sort together
+        suffix = f"_{rendition.name}" if rendition else ""
+        streams = self._streams(input_file, rendition)
+        return PlannedSegment(input_file, start_time, duration,
+                              os.path.join(output_folder, f"segment_{key[:16]}{suffix}{extension}"), rendition,
+                              streams)
+
+    def _streams(self, input_file, rendition=None):
+        """Decide per stream whether a cut of input_file copies or encodes it, from the catalogued probe data."""
+        return analyze_streams(self.catalog.get(input_file), self.mode, rendition, self.stream_copy)
+
+    def _key(self, segment):
+        return segment_key(segment.input_file, segment.start_time, segment.duration, self.mode, self.layout,
+                           segment.rendition, segment.streams)
+
+    def _duration_or_none(self, input_file):
+        try:
+            return self.catalog.duration(input_file)
+        except (subprocess.SubprocessError, ValueError, OSError):
+            return None  # Unreadable, never drawn
+
+    def _keyframe_starts(self, input_file):
+        """Return the starts plan_starts may use for a stream copy of input_file: its keyframes, None for any time."""
+        try:
+            return self.catalog.keyframes(input_file) or None
+        except (subprocess.SubprocessError, ValueError, OSError):
+            return []  # The packet index could not be read, so no start is known to be on a keyframe: never drawn
+
+    @_hooks_catalog
+    def plan(self, input_files, output_folder, duration, total_segments):
+        """Plan total_segments segments drawn from input_files, weighted by length and not overlapping."""
+        with self.metrics.stage("plan", requested=total_segments) as stage:
+            durations = {input_file: self._duration_or_none(input_file) for input_file in input_files}
+            # Stream copy can only start on a keyframe, so only keyframes are offered as starts
+            candidates = self._keyframe_starts if self.mode == COPY else None
+            starts = plan_starts(durations, total_segments, duration, self.max_overlap, candidates)
+            if len(starts) < total_segments:
+                # The sources cannot hold that many segments of this length, say so instead of cutting fewer quietly
+                self._emit("shortfall", requested=total_segments, planned=len(starts), sources=len(input_files))
+            # Every rendition of a cut is a segment of its own, cut_batch writes them from one decode
+            planned = [self.planned_segment(input_file, start_time, duration, output_folder, rendition)
+                       for input_file, start_time in starts for rendition in self.renditions or [None]]
+            stage["planned"] = len(planned)
+        return planned
+
+    def _chunks(self):
+        """Return the pool that encodes the chunks of long segments, created on first use."""
+        with self._chunk_pool_lock:
+            if self._chunk_pool is None:
+                self._chunk_pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="chunk")
+            return self._chunk_pool
+
+    def _chunk_runner(self, segment, batch_id):
+        """Return the run function for the chunks of a segment, reporting their progress as that of the segment."""
+        lock = threading.Lock()
+        chunks = {}  # chunk number -> (seconds, fraction, fps)
+        numbers = itertools.count()
+
+        def run(command, seconds):
+            if not seconds:
+                # The join only encodes the audio, the video is all done by then
+                return self._run(command, batch_id, 1, segment.duration, report=lambda snapshot: None)
+            number = next(numbers)
+
+            def report(snapshot):
+                # Chunks run side by side: the segment is as far as the seconds done in all of them
+                with lock:
+                    fps = 0.0 if snapshot["finished"] else snapshot["fps"]
+                    chunks[number] = (seconds, snapshot["fraction"] or 0.0, fps)
+                    fraction = sum(length * done for length, done, _ in chunks.values()) / segment.duration
+                    fps = sum(fps for _, _, fps in chunks.values())
+                self._report(batch_id, 1, {**snapshot, "fraction": min(fraction, 1.0), "fps": fps})
+
+            self._run(command, batch_id, 1, seconds, report)
+            with lock:
+                chunks[number] = (seconds, 1.0, 0.0)  # Finished, whatever its last report said
+
+        return run
+
+    @_hooks_catalog
+    def cut_segment(self, segment, batch_id=None, threads=None):
+        """Cut a single planned segment."""
+        if self.mode == SMART:
+            return run_smart_cut(segment.input_file, segment.output_file, segment.start_time, segment.duration,
+                                 self.catalog.keyframes(segment.input_file),
+                                 self.catalog.get(segment.input_file)["video_codec"],
+                                 run=lambda command: self._run(command, batch_id, 1, segment.duration),
+                                 threads=threads, layout=self.layout, copy_audio=copies_audio(segment.streams))
+        if self._chunked(segment):
+            return run_chunked_cut(segment.input_file, segment.output_file, segment.start_time, segment.duration,
+                                   self.chunk_seconds, self.catalog.keyframes(segment.input_file),
+                                   run=self._chunk_runner(segment, batch_id),
+                                   pool=self._chunks(), threads=threads, layout=self.layout,
+                                   rendition=segment.rendition, copy_audio=copies_audio(segment.streams))
+
+        command = build_cut_command(segment.input_file, segment.output_file, segment.start_time,
+                                    segment.duration, self.mode, threads, self.layout, segment.rendition,
+                                    copies_audio(segment.streams))
+
+        # Execute the command
+        self._run(command, batch_id, 1, segment.duration)
+        return segment.output_file
+
+    def _fetch_cached(self, segments):
+        """Serve the segments the cache already has; return the ones that still need ffmpeg."""
+        if self.cache is None:
+            return segments
+        missing = [segment for segment in segments if not self.cache.fetch(self._key(segment), segment.output_file)]
+        hits = len(segments) - len(missing)
+        if hits:
+            self.metrics.increment("cache_hits_total", hits)
+            self.metrics.event("cached", segments=hits, source=segments[0].input_file)
+        return missing
+
+    @_hooks_catalog
+    def cut_batch(self, segments, batch_id=None):
+        """Cut several planned segments of the same source with a single ffmpeg process."""
+        # plan() only names the outputs, their folder may not exist yet
+        for folder in {os.path.dirname(segment.output_file) for segment in segments}:
+            os.makedirs(folder or os.curdir, exist_ok=True)
+        to_cut = self._fetch_cached(segments)
+        if not to_cut:
+            self._finish_batch(batch_id, segments)
+            return [segment.output_file for segment in segments]
+        # ffmpeg writes next to the final name, which only ever holds a complete file
+        parts = [segment._replace(output_file=part_path(segment.output_file)) for segment in to_cut]
+        # A run that was killed leaves its .part files behind, and ffmpeg will not overwrite them
+        self._remove_outputs(part.output_file for part in parts)
+        threads = self._acquire_slot()
+        try:
+            if self.mode == SMART or len(parts) == 1 or self._chunked(parts[0]):
+                # Smart render and chunked encoding need several processes per segment, so they cannot share one
+                for part in parts:
+                    self.cut_segment(part, batch_id, threads)
+            else:
+                # Every output reads its own input, and ffmpeg moves them forward side by side
+                expected_seconds = max(part.duration for part in parts)
+                self._run(build_batch_command(parts, self.mode, threads, self.layout), batch_id, len(parts),
+                          expected_seconds)
+            for part, segment in zip(parts, to_cut):
+                os.replace(part.output_file, segment.output_file)
+                if self.cache is not None:
+                    self.cache.store(self._key(segment), segment.output_file)
+        except CancelledError:
+            self._remove_outputs(part.output_file for part in parts)
+            raise
+        except (subprocess.CalledProcessError, ProcessTimeout):
+            self._remove_outputs(part.output_file for part in parts)
+            self.metrics.increment("segments_failed_total", len(to_cut))
+            raise
+        else:
+            written = sum(os.path.getsize(segment.output_file) for segment in to_cut)
+            self.metrics.increment("segments_done_total", len(to_cut))
+            self.metrics.increment("bytes_written_total", written)
+            self.metrics.event("written", batch=batch_id, segments=len(to_cut), bytes=written,
+                               source=segments[0].input_file)
+            return [segment.output_file for segment in segments]
+        finally:
+            self._finish_batch(batch_id, segments)
+            self._release_slot(len(to_cut))
+
+    def _finish_batch(self, batch_id, segments):
+        with self._stats_lock:
+            self._active.pop(batch_id, None)
+            self._finished_segments += len(segments)
+
+    @staticmethod
+    def _remove_outputs(output_files):
+        """Delete what a killed or failed ffmpeg left behind, a truncated MP4 is not playable."""
+        for output_file in output_files:
+            try:
+                os.remove(output_file)
+            except FileNotFoundError:
+                pass
+
+    def _acquire_slot(self):
+        """Wait until the scheduler allows another job; return the encoder threads it should use."""
+        if self.scheduler is None:
+            return None  # The pool size alone limits the jobs, ffmpeg picks its own thread count
+        with self._slots:
+            while self._running_jobs >= self.scheduler.jobs:
+                self._slots.wait()
+            self._running_jobs += 1
+            return self.scheduler.threads
+
+    def _release_slot(self, segments):
+        if self.scheduler is None:
+            return
+        decision = self.scheduler.record(segments)
+        with self._slots:
+            self._running_jobs -= 1
+            self._slots.notify_all()
+        if decision:
+            self._emit("schedule", **decision)
+
+    @_hooks_catalog
+    def run(self, segments, journal=None):
+        """Cut planned segments with a pool of ffmpeg workers.
+
+        on_progress, if set, is called with one event dict per step ("start",
+        "progress", "schedule", "segment", "failed", "finish"). "progress" and
+        "schedule" events come from the worker threads, the others from the
+        calling thread. Finished and failed segments are recorded in the
+        journal, if given.
+        Returns the "finish" event.
+        """
+        # Keep batches small enough that every worker gets one
+        batch_size = max(1, min(MAX_OUTPUTS_PER_PROCESS, -(-len(segments) // self.workers)))
+        batches = group_by_source(segments, batch_size)
+
+        started = self._begin(len(segments))
+        self._emit("start", total=len(segments), workers=self.workers, mode=self.mode)
+        counts = {"done": 0, "created": 0, "total": len(segments)}
+        stop_watchdog, watchdog = self._start_watchdog()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.cut_batch, batch, batch_id): (batch, batch_id)
+                       for batch_id, batch in enumerate(batches)}
+            for future in as_completed(futures):
+                self._collect(future, *futures[future], counts, journal)
+        stop_watchdog.set()
+        watchdog.join()
+        return self._finish(started, counts)
+
+    def _begin(self, total):
+        """Reset the live figures for a new job; return its start time."""
+        with self._stats_lock:
+            self._active.clear()
+            self._finished_segments = 0
+            self._total_segments = total
+            self._batch_usage.clear()
+            self._job_usage = new_summary()
+        self._started = time.monotonic()
+        if self.scheduler:
+            self.scheduler.start()
+        return self._started
+
+    def _start_watchdog(self):
+        stop = threading.Event()
+        watchdog = threading.Thread(target=self._watchdog, args=(stop,), daemon=True)
+        watchdog.start()
+        return stop, watchdog
+
+    def _collect(self, future, batch, batch_id, counts, journal=None):
+        """Emit the outcome of a finished batch, counting it in counts["done"] and counts["created"]."""
+        with self._stats_lock:
+            # Shared by every segment of the batch when they were cut by one process
+            usage = self._batch_usage.pop(batch_id, None)
+        try:
+            segment_files = future.result()
+        except CancelledError:
+            return  # Killed by cancel(), not a failure
+        except (subprocess.CalledProcessError, ProcessTimeout) as e:
+            counts["done"] += len(batch)
+            if journal:
+                for segment in batch:
+                    journal.failed(segment, str(e))
+            self._emit("failed", error=str(e), segments=len(batch), done=counts["done"], total=counts["total"],
+                       usage=usage)
+            return
+        for segment, segment_file in zip(batch, segment_files):
+            if journal:
+                journal.done(segment)
+            counts["done"] += 1
+            counts["created"] += 1
+            self._emit("segment", output=segment_file, done=counts["done"], total=counts["total"], usage=usage,
+                       streams=describe(segment.streams))
+
+    def _finish(self, started, counts):
+        elapsed = time.monotonic() - started
+        with self._chunk_pool_lock:
+            if self._chunk_pool is not None:
+                self._chunk_pool.shutdown()
+                self._chunk_pool = None
+        rate = counts["created"] / elapsed if elapsed > 0 else 0.0
+        self.metrics.flush()
+        finish = self._emit("finish", created=counts["created"], total=counts["total"], elapsed=elapsed, rate=rate,
+                            workers=self.scheduler.jobs if self.scheduler else self.workers,
+                            cancelled=self._cancelled.is_set(), usage=dict(self._job_usage))
+        self._cancelled.clear()  # The engine can be run again
+        return finish
+
+    @_hooks_catalog
+    def split_source(self, input_file, output_folder, segment_seconds, duration=None, batch_id=None, name=None):
+        """Cut one source into consecutive segment_seconds pieces with a single ffmpeg process; return their paths.
+
+        Pieces are named name_0000, name_0001, ...; name defaults to the source's file name without extension.
+        """
+        name = name or os.path.splitext(os.path.basename(input_file))[0]
+        extension = OUTPUT_LAYOUTS[self.layout]["extension"]
+        output_pattern = os.path.join(output_folder, name.replace("%", "%%") + "_%04d" + extension)
+        list_file = os.path.join(output_folder, f".{name}.segments")
+        pieces = math.ceil(duration / segment_seconds) if duration else 1
+        streams = self._streams(input_file)
+        threads = self._acquire_slot()
+        try:
+            self._run(build_split_command(input_file, output_pattern, list_file, segment_seconds, self.mode, threads,
+                                          self.layout, copies_audio(streams)), batch_id, pieces, duration)
+            with open(list_file, newline="") as f:
+                listed = [(os.path.join(output_folder, row[0]), float(row[2]) - float(row[1]))
+                          for row in csv.reader(f) if row]
+            # The source rarely ends on a boundary, and a piece of a frame or two is no use to anyone
+            self._remove_outputs(output_file for output_file, length in listed if length < MIN_PIECE_SECONDS)
+            output_files = [output_file for output_file, length in listed if length >= MIN_PIECE_SECONDS]
+        except (CancelledError, subprocess.CalledProcessError, ProcessTimeout) as e:
+            # The piece being written when ffmpeg stopped is not in the list, so clear them by number
+            self._remove_outputs(output_pattern % i for i in range(pieces + 1))
+            if not isinstance(e, CancelledError):
+                self.metrics.increment("segments_failed_total", pieces)
+            raise
+        finally:
+            if os.path.exists(list_file):
+                os.remove(list_file)
+            with self._stats_lock:
+                self._active.pop(batch_id, None)
+                self._finished_segments += pieces
+            self._release_slot(pieces)
+        written = sum(os.path.getsize(output_file) for output_file in output_files)
+        self.metrics.increment("segments_done_total", len(output_files))
+        self.metrics.increment("bytes_written_total", written)
+        self.metrics.event("written", batch=batch_id, segments=len(output_files), bytes=written, source=input_file)
+        return output_files
+
+    @_hooks_catalog
+    def split(self, input_folder, output_folder, segment_seconds):
+        """Cut every video of input_folder into consecutive pieces, one ffmpeg process per source.
+
+        Pieces are named after their source (clip_0000.mp4, clip_0001.mp4, ...);
+        sources that share a name in different folders get a hash of their path
+        added (clip_1a2b3c4d_0000.mp4) so their pieces do not overwrite each other.
+        "total" in the events starts as an estimate from the catalogued durations
+        and is corrected as each source finishes. Returns the "finish" event.
+        """
+        if self.renditions:
+            raise ValueError("Rendition ladders are not supported when splitting whole files.")
+        self._cancelled.clear()
+        input_files = self.scan(input_folder, exclude=[output_folder])
+        if not input_files:
+            raise ValueError("No valid video files found in the input folder.")
+        os.makedirs(output_folder, exist_ok=True)
+        durations = {input_file: self._duration_or_none(input_file) for input_file in input_files}
+        sources = [input_file for input_file in input_files if durations[input_file]]
+        estimates = {input_file: math.ceil(durations[input_file] / segment_seconds) for input_file in sources}
+        stems = {input_file: os.path.splitext(os.path.basename(input_file))[0] for input_file in sources}
+        shared = {stem for stem, uses in collections.Counter(stems.values()).items() if uses > 1}
+        names = {input_file: f"{stem}_{hashlib.sha256(os.path.abspath(input_file).encode()).hexdigest()[:8]}"
+                 if stem in shared else stem for input_file, stem in stems.items()}
+
+        started = self._begin(sum(estimates.values()))
+        counts = {"done": 0, "created": 0, "total": sum(estimates.values())}
+        self._emit("start", total=counts["total"], workers=self.workers, mode=self.mode)
+        stop_watchdog, watchdog = self._start_watchdog()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.split_source, input_file, output_folder, segment_seconds,
+                                   durations[input_file], batch_id, names[input_file]): (input_file, batch_id)
+                       for batch_id, input_file in enumerate(sources)}
+            for future in as_completed(futures):
+                input_file, batch_id = futures[future]
+                with self._stats_lock:
+                    usage = self._batch_usage.pop(batch_id, None)
+                try:
+                    output_files = future.result()
+                except CancelledError:
+                    continue
+                except (subprocess.CalledProcessError, ProcessTimeout) as e:
+                    counts["done"] += estimates[input_file]
+                    self._emit("failed", error=str(e), segments=estimates[input_file], done=counts["done"],
+                               total=counts["total"], usage=usage)
+                    continue
+                counts["total"] += len(output_files) - estimates[input_file]
+                for output_file in output_files:
+                    counts["done"] += 1
+                    counts["created"] += 1
+                    self._emit("segment", output=output_file, done=counts["done"], total=counts["total"],
+                               usage=usage, streams=describe(self._streams(input_file)))
+        stop_watchdog.set()
+        watchdog.join()
+        return self._finish(started, counts)
+
+    @_hooks_catalog
+    def generate(self, input_folder, output_folder, duration, total_segments, resume=True):
+        """Scan, plan and run in one call, the way the GUI and the command line use the engine.
+
+        The plan is journaled in the output folder; with resume, running the same job
+        again only cuts the segments that are not finished yet.
+        """
+        self._cancelled.clear()
+        # The output folder may sit inside a recursively scanned input folder, its segments are not sources
+        input_files = self.scan(input_folder, exclude=[output_folder])
+        if not input_files:
+            raise ValueError("No valid video files found in the input folder.")
+        os.makedirs(output_folder, exist_ok=True)
+        journal = JobJournal(output_folder)
+        job = {"input": os.path.abspath(input_folder), "output": os.path.abspath(output_folder),
+               "duration": duration, "count": total_segments, "mode": self.mode, "layout": self.layout,
+               "renditions": [rendition.name for rendition in self.renditions] if self.renditions else None,
+               "stream_copy": self.stream_copy}
+        try:
+            resumed = journal.resume(job) if resume else None
+            if resumed:
+                segments, finished = resumed
+                self._emit("resume", finished=len(finished), pending=len(segments), journal=journal.path)
+            else:
+                segments = self.plan(input_files, output_folder, duration, total_segments)
+                journal.start(job, segments)
+            return self.run(segments, journal)
+        finally:
+            journal.close()
+
+    @_hooks_catalog
+    def watch(self, input_folder, output_folder, duration, segments_per_file, settle_seconds=DEFAULT_SETTLE_SECONDS,
+              poll_seconds=DEFAULT_POLL_SECONDS, use_inotify=True):
+        """Cut segments from every video that appears in input_folder until cancel() is called.
+
+        Each file is queued once it has stopped growing, and its segments go to one
+        long-lived worker pool. Files finished by an earlier watch of the same output
+        folder are skipped. Emits "watch" and "queued" events besides the run() ones.
+        Returns the "finish" event.
+        """
+        self._cancelled.clear()
+        os.makedirs(output_folder, exist_ok=True)
+        state_path = os.path.join(output_folder, WATCH_STATE_NAME)
+        watcher = FolderWatcher(os.path.abspath(input_folder), self.recursive, settle_seconds, poll_seconds,
+                                exclude=[output_folder], known=load_watch_state(state_path), use_inotify=use_inotify)
+        started = self._begin(0)
+        self._emit("watch", folder=input_folder, detection=watcher.mode, workers=self.workers, mode=self.mode)
+        counts = {"done": 0, "created": 0, "total": 0}
+        batch_ids = itertools.count()
+        outstanding = {}  # input file -> batches still running
+        stop_watchdog, watchdog = self._start_watchdog()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {}
+                while not self._cancelled.is_set():
+                    for input_file in watcher.poll(WATCH_POLL_TIMEOUT):
+                        self.catalog.refresh([input_file], 1, keyframes=self._wants_keyframes)
+                        segments = self.plan([input_file], output_folder, duration, segments_per_file)
+                        self._emit("queued", input=input_file, segments=len(segments))
+                        if not segments:
+                            # Too short or unreadable, nothing to wait for
+                            append_watch_state(state_path, input_file, *watcher.known[input_file])
+                            continue
+                        counts["total"] += len(segments)
+                        with self._stats_lock:
+                            self._total_segments += len(segments)
+                        batch_size = max(1, min(MAX_OUTPUTS_PER_PROCESS, -(-len(segments) // self.workers)))
+                        for batch in group_by_source(segments, batch_size):
+                            batch_id = next(batch_ids)
+                            futures[pool.submit(self.cut_batch, batch, batch_id)] = (batch, batch_id)
+                            outstanding[input_file] = outstanding.get(input_file, 0) + 1
+                    for future in [future for future in futures if future.done()]:
+                        batch, batch_id = futures.pop(future)
+                        self._collect(future, batch, batch_id, counts)
+                        input_file = batch[0].input_file
+                        outstanding[input_file] -= 1
+                        if not outstanding[input_file] and not self._cancelled.is_set():
+                            # Every segment of the file was attempted, a restart will not queue it again
+                            del outstanding[input_file]
+                            append_watch_state(state_path, input_file, *watcher.known[input_file])
+                # Cancelled: queued batches stop before starting ffmpeg, running ones are being killed
+                for future in as_completed(futures):
+                    self._collect(future, *futures[future], counts)
+        finally:
+            watcher.close()
+            stop_watchdog.set()
+            watchdog.join()
+        return self._finish(started, counts)
@@ -0,0 +1,117 @@
+"""Append-only journal of a job's planned segments and which of them are finished.
+
+The journal lives in the output folder, one JSON object per line:
+
+    {"type": "job", "job": {"input": ..., "output": ..., "duration": 10, "count": 100, "mode": "copy"}}
+    {"type": "plan", "id": 0, "input": ..., "start": 12.5, "duration": 10, "mode": "copy", "codec": [...],
+     "output": ..., "rendition": ["720p", 720], "streams": {"video": {"action": "encode", "reason": ...}, ...}}
+    {"type": "done", "id": 0, "size": 1048576}
+    {"type": "failed", "id": 3, "error": "..."}
+
+Running the same job again reads it back, keeps the plan and only cuts the
+segments whose output is missing or not the size that was recorded.
+"""
+import json
+import os
+
+from compatibility import describe, from_description
+from cutting import PlannedSegment, Rendition, codec_args
+
+JOURNAL_NAME = ".segmentcutter-journal.jsonl"
+
+
+def _read_records(path):
+    """Return the records of a journal and the length of its intact part."""
+    records = []
+    intact = 0
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Torn last line from a crash, everything before it is intact
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+                intact += len(line)
+    except FileNotFoundError:
+        pass
+    return records, intact
+
+
+class JobJournal:
+    """Plan and completion record of one job, safe to resume after a crash or reboot."""
+
+    def __init__(self, output_folder):
+        self.path = os.path.join(output_folder, JOURNAL_NAME)
+        self.segments = []
+        self._ids = {}  # PlannedSegment -> index in the plan
+        self._file = None
+
+    def resume(self, job):
+        """Load the plan of an earlier run of the same job; return (pending, finished) or None if there is none."""
+        records, intact = _read_records(self.path)
+        if not records or records[0].get("type") != "job" or records[0]["job"] != job:
+            return None
+        sizes = {}
+        for record in records[1:]:
+            if record["type"] == "plan":
+                rendition = Rendition(*record["rendition"]) if record.get("rendition") else None
+                self._add(PlannedSegment(record["input"], record["start"], record["duration"], record["output"],
+                                         rendition, from_description(record.get("streams")) or None))
+            elif record["type"] == "done":
+                sizes[record["id"]] = record["size"]
+            elif record["type"] == "failed":
+                sizes.pop(record["id"], None)
+        finished = []
+        pending = []
+        for index, segment in enumerate(self.segments):
+            # Only trust an output that is still there with the size it had when it was finished
+            try:
+                verified = os.path.getsize(segment.output_file) == sizes.get(index)
+            except OSError:
+                verified = False
+            (finished if verified else pending).append(segment)
+        self._file = open(self.path, "a")
+        # Drop a line torn by a crash, so the next record starts on a line of its own
+        self._file.truncate(intact)
+        return pending, finished
+
+    def start(self, job, segments):
+        """Begin a new journal for a freshly planned job, replacing any earlier one."""
+        self.segments = []
+        self._ids.clear()
+        self._file = open(self.path, "w")
+        self._write({"type": "job", "job": job})
+        for segment in segments:
+            self._write({"type": "plan", "id": self._add(segment), "input": segment.input_file,
+                         "start": segment.start_time, "duration": segment.duration, "mode": job["mode"],
+                         "codec": codec_args(job["mode"]), "output": segment.output_file,
+                         "rendition": segment.rendition, "streams": describe(segment.streams)}, sync=False)
+        self._sync()
+
+    def done(self, segment):
+        self._write({"type": "done", "id": self._ids[segment], "size": os.path.getsize(segment.output_file)})
+
+    def failed(self, segment, error):
+        self._write({"type": "failed", "id": self._ids[segment], "error": error})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _add(self, segment):
+        self._ids[segment] = len(self.segments)
+        self.segments.append(segment)
+        return self._ids[segment]
+
+    def _write(self, record, sync=True):
+        self._file.write(json.dumps(record) + "\n")
+        if sync:
+            self._sync()
+
+    def _sync(self):
+        # A finished segment must be on disk before it is skipped by the next run
+        self._file.flush()
+        os.fsync(self._file.fileno())
@@ -1,6 +1,5 @@
 from tabnanny import check
 import os
-import random
 import subprocess
 import tkinter as tk
 from tkinter import filedialog, messagebox
@@ -8,8 +7,19 @@ from ttkbootstrap import Style, Progressbar
 from PIL import Image, ImageTk
 import pygame
 import threading  # Import threading
+import queue
+import time
 import webbrowser  # Import webbrowser module for hyperlink
+from cache import SegmentCache
+from catalog import MediaCatalog
+from cutting import ENCODING_MODES, REENCODE
+import engine
+from engine import default_worker_count
 
+# GUI refresh rate for job progress (~30 frames per second)
+FRAME_INTERVAL_MS = 33
+# Lines kept in the output log, older lines are dropped
+LOG_MAX_LINES = 500
 
 def installer():
     import argparse
@@ -335,6 +345,10 @@ def cutter():
     pygame.mixer.music.load("music.mp3")  # Load your background music
     pygame.mixer.music.play(-1)  # Loop the music indefinitely
 
+    # Cached ffprobe results, shared by every segment of every job
+    catalog = MediaCatalog()
+    # Finished segments, so asking for the same cut again costs nothing
+    segment_cache = SegmentCache()
 
     def select_input_folder():
         """Open a folder dialog to select the input folder."""
@@ -342,7 +356,10 @@ def cutter():
         if folder_path:
             entry_input_folder.delete(0, tk.END)
             entry_input_folder.insert(0, folder_path)
-            list_videos(folder_path)
+            video_files = list_videos(folder_path)
+            # Probe the folder once in the background so segments never wait on ffprobe
+            threading.Thread(target=catalog.refresh, args=([os.path.join(folder_path, f) for f in video_files],),
+                             daemon=True).start()
 
     def select_output_folder():
         """Open a folder dialog to select the output folder."""
@@ -353,9 +370,7 @@ def cutter():
 
     def list_videos(folder):
         """List all video files in the input folder."""
-        video_extensions = ['.mp4', '.mkv', '.avi', '.mov']
-        video_files = [f for f in os.listdir(folder) if
-                       os.path.isfile(os.path.join(folder, f)) and os.path.splitext(f)[1].lower() in video_extensions]
+        video_files = engine.list_videos(folder)
         if video_files:
             label_video_count.config(text=f"Found {len(video_files)} videos.", bg='lightgray')
             return video_files
@@ -363,66 +378,90 @@ def cutter():
             label_video_count.config(text="No video files found.", bg='lightgray')
             return []
 
-    def generate_random_segment(input_file, output_folder, duration):
-        """Generate a random segment from the input video file."""
-        command = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of",
-                   "default=noprint_wrappers=1:nokey=1", input_file]
-        video_duration = float(subprocess.check_output(command).strip())
-
-        # Random start time
-        max_start_time = video_duration - duration
-        if max_start_time < 0:
-            return None
-
-        start_time = random.uniform(0, max_start_time)
-        output_file = os.path.join(output_folder, f"segment_{random.randint(1000, 9999)}.mp4")
-
-        # Construct FFmpeg command with re-encoding for better quality
-        command = [
-            "ffmpeg",
-            "-ss", str(start_time),  # Seek to the start time
-            "-i", input_file,  # Input file
-            "-t", str(duration),  # Duration of the segment
-            "-c:v", "libx264",  # Video codec (H.264)
-            "-preset", "medium",  # Encoding speed
-            "-crf", "23",  # Constant Rate Factor for quality (lower is better)
-            "-c:a", "aac",  # Audio codec
-            "-b:a", "192k",  # Audio bitrate
-            "-movflags", "+faststart",  # Allow for quicker playback
-            output_file
-        ]
-
-        # Execute the command
-        subprocess.run(command, check=True)
-        return output_file
-
     # Track mute state
     global muted
     muted = False
 
-    def generate_segments(input_folder, output_folder, duration, total_segments):
-        """Generate video segments in a separate thread."""
-        video_files = list_videos(input_folder)
-        if not video_files:
-            messagebox.showerror("Input Error", "No valid video files found in the input folder.")
-            return
-
-        # Clear output area
-        output_text.delete(1.0, tk.END)
-
-        # Generate segments
-        progress_bar['value'] = 0
-        progress_bar['maximum'] = total_segments
-        for i in range(total_segments):
-            video_file = random.choice(video_files)
-            segment_file = generate_random_segment(os.path.join(input_folder, video_file), output_folder, duration)
-            if segment_file:
-                output_text.insert(tk.END, f"Segment created: {os.path.basename(segment_file)}\n")
-                output_text.yview(tk.END)  # Scroll to the end
-                progress_bar['value'] += 1
-                root.update()  # Update the GUI
-
-        messagebox.showinfo("Success", f"{total_segments} segments created in '{output_folder}'.")
+    # Worker threads never touch widgets: they post events here and the Tk thread drains them
+    progress_events = queue.Queue()
+    job = {"started": None, "done": 0, "total": 0, "overall": 0.0, "fps": 0.0, "eta": None, "output_folder": "",
+           "engine": None}
+
+    def show_progress(event):
+        """Apply one engine progress event to the GUI and return the log line it produces."""
+        if event["event"] == "start":
+            progress_bar['value'] = 0
+            progress_bar['maximum'] = event["total"]
+            job.update(started=time.monotonic(), done=0, total=event["total"], overall=0.0, fps=0.0, eta=None)
+        elif event["event"] == "shortfall":
+            return (f"Only {event['planned']} of {event['requested']} segments fit in the "
+                    f"{event['sources']} source files\n")
+        elif event["event"] == "resume":
+            return f"Resuming job: {event['finished']} segments already done, {event['pending']} to go\n"
+        elif event["event"] == "progress":
+            job.update(overall=event["overall"], fps=event["fps_total"], eta=event["eta_total"])
+        elif event["event"] == "segment":
+            job["done"] = event["done"]
+            return f"Segment created: {os.path.basename(event['output'])}\n"
+        elif event["event"] == "failed":
+            job["done"] = event["done"]
+            return f"Segment failed: {event['error']}\n"
+        elif event["event"] == "finish":
+            job["started"] = None
+            progress_bar['value'] = job["done"]
+            if event["cancelled"]:
+                messagebox.showinfo("Cancelled", f"Cancelled after {event['created']} segments.")
+                return f"Cancelled after {event['created']} segments\n"
+            messagebox.showinfo("Success", f"{event['created']} segments created in '{job['output_folder']}' "
+                                           f"({event['rate']:.2f} segments/sec).")
+            return (f"{event['created']} segments in {event['elapsed']:.1f}s with "
+                    f"{event['workers']} workers ({event['rate']:.2f} segments/sec)\n")
+        elif event["event"] == "error":
+            messagebox.showerror("Input Error", event["error"])
+        return ""
+
+    def drain_progress():
+        """Apply queued progress events once per frame, coalescing their log lines into one insert."""
+        lines = []
+        while True:
+            try:
+                lines.append(show_progress(progress_events.get_nowait()))
+            except queue.Empty:
+                break
+        if any(lines):
+            output_text.insert(tk.END, "".join(lines))
+            # Keep the log a fixed-size ring buffer
+            excess = int(output_text.index("end-1c").split(".")[0]) - LOG_MAX_LINES
+            if excess > 0:
+                output_text.delete("1.0", f"{excess + 1}.0")
+            output_text.yview(tk.END)  # Scroll to the end
+        if job["started"] is not None:
+            # Fractional progress from ffmpeg keeps the bar moving during long segments
+            progress_bar['value'] = max(job["done"], job["overall"] * job["total"])
+            elapsed = time.monotonic() - job["started"]
+            rate = job["done"] / elapsed if elapsed > 0 else 0.0
+            eta = f"{job['eta']:.0f}s" if job["eta"] is not None else "--"
+            label_stats.config(text=f"{job['done']}/{job['total']} segments, {rate:.2f} segments/sec, "
+                                    f"{job['fps']:.0f} fps, ETA {eta}")
+        root.after(FRAME_INTERVAL_MS, drain_progress)
+
+    def generate_segments(input_folder, output_folder, duration, total_segments, workers=None, mode=REENCODE,
+                          split=False):
+        """Generate video segments in a separate thread using a pool of ffmpeg workers."""
+        segment_engine = engine.SegmentEngine(catalog, workers, mode, on_progress=progress_events.put,
+                                              cache=segment_cache)
+        job["engine"] = segment_engine
+        try:
+            if split:
+                # Every file cut into consecutive pieces, the segment count follows from the durations
+                segment_engine.split(input_folder, output_folder, duration)
+            else:
+                segment_engine.generate(input_folder, output_folder, duration, total_segments)
+        except (ValueError, OSError) as e:
+            # An unreadable input folder or an unwritable output folder, the thread would otherwise end silently
+            progress_events.put({"event": "error", "error": str(e)})
+        finally:
+            job["engine"] = None
 
     def on_submit():
         """Get inputs and start segment generation in a new thread."""
@@ -430,23 +469,38 @@ def cutter():
         output_folder = entry_output_folder.get()
         duration = entry_duration.get()
         total_segments = entry_total_segments.get()
+        workers = entry_workers.get()
+        mode = ENCODING_MODES[encoding_mode.get()]
+        split = split_files.get()
 
-        if not input_folder or not output_folder or not duration or not total_segments:
+        if not input_folder or not output_folder or not duration or not (total_segments or split):
             messagebox.showwarning("Input Error", "Please fill all fields.")
             return
 
         try:
             duration = int(duration)
-            total_segments = int(total_segments)
+            total_segments = int(total_segments) if total_segments else None
+            if workers != "auto":
+                workers = int(workers) if workers else default_worker_count()
         except ValueError:
-            messagebox.showerror("Input Error", "Duration and Total Segments must be integers.")
+            messagebox.showerror("Input Error", "Duration and Total Segments must be integers, Workers an integer "
+                                                "or 'auto'.")
             return
 
+        list_videos(input_folder)
+        job["output_folder"] = output_folder
+        output_text.delete(1.0, tk.END)  # Clear output area
+
         # Start the segment generation in a new thread
         thread = threading.Thread(target=generate_segments,
-                                  args=(input_folder, output_folder, duration, total_segments))
+                                  args=(input_folder, output_folder, duration, total_segments, workers, mode, split))
         thread.start()
 
+    def on_cancel():
+        """Stop the running job, killing its ffmpeg processes."""
+        if job["engine"] is not None:
+            job["engine"].cancel()
+
     def adjust_volume(val):
         """Adjust the volume of the music."""
         volume = float(val)  # Get volume from slider
@@ -512,23 +566,39 @@ def cutter():
     entry_total_segments = tk.Entry(frame)
     entry_total_segments.grid(row=4, column=1, padx=10, pady=10, sticky="w")
 
-    tk.Button(frame, text="Submit", command=on_submit).grid(row=5, column=0, columnspan=3, padx=10, pady=10)
+    tk.Label(frame, text="Parallel Workers:", bg='lightgray').grid(row=5, column=0, padx=10, pady=10, sticky="e")
+    entry_workers = tk.Entry(frame)
+    entry_workers.insert(0, str(default_worker_count()))
+    entry_workers.grid(row=5, column=1, padx=10, pady=10, sticky="w")
+
+    tk.Label(frame, text="Encoding Mode:", bg='lightgray').grid(row=6, column=0, padx=10, pady=10, sticky="e")
+    encoding_mode = tk.StringVar(value=next(iter(ENCODING_MODES)))
+    tk.OptionMenu(frame, encoding_mode, *ENCODING_MODES).grid(row=6, column=1, padx=10, pady=10, sticky="w")
+    split_files = tk.BooleanVar(value=False)
+    tk.Checkbutton(frame, text="Split whole files", variable=split_files, bg='lightgray').grid(
+        row=6, column=2, padx=10, pady=10, sticky="w")
+
+    tk.Button(frame, text="Submit", command=on_submit).grid(row=7, column=0, columnspan=2, padx=10, pady=10)
+    tk.Button(frame, text="Cancel", command=on_cancel).grid(row=7, column=2, padx=10, pady=10)
 
     progress_bar = Progressbar(frame, length=300, bootstyle='success')
-    progress_bar.grid(row=6, column=0, columnspan=3, padx=10, pady=10)
+    progress_bar.grid(row=8, column=0, columnspan=3, padx=10, pady=10)
+
+    label_stats = tk.Label(frame, text="", bg='lightgray')
+    label_stats.grid(row=9, column=0, columnspan=3, padx=10, pady=0)
 
     output_text = tk.Text(frame, height=10, width=60, wrap='word', bg='white')
-    output_text.grid(row=7, column=0, columnspan=3, padx=10, pady=10)
+    output_text.grid(row=10, column=0, columnspan=3, padx=10, pady=10)
 
     # Add volume control and mute button
-    tk.Label(frame, text="Volume Control:", bg='lightgray').grid(row=8, column=0, padx=10, pady=10, sticky="e")
+    tk.Label(frame, text="Volume Control:", bg='lightgray').grid(row=11, column=0, padx=10, pady=10, sticky="e")
     volume_slider = tk.Scale(frame, from_=0, to=1, resolution=0.1, orient=tk.HORIZONTAL, command=adjust_volume,
                               bg='lightgray')
     volume_slider.set(0.5)  # Set default volume to 50%
-    volume_slider.grid(row=8, column=1, padx=10, pady=10, sticky="w")
+    volume_slider.grid(row=11, column=1, padx=10, pady=10, sticky="w")
 
     mute_button = tk.Button(frame, text="Mute", command=toggle_mute)
-    mute_button.grid(row=8, column=2, padx=10, pady=10)
+    mute_button.grid(row=11, column=2, padx=10, pady=10)
 
     # Create a hyperlink label
     hyperlink_label = tk.Label(root, text="ARBOFF on Github", fg="blue", cursor="hand2", bg='lightgray')
@@ -536,6 +606,7 @@ def cutter():
     hyperlink_label.bind("<Button-1>", open_link)  # Bind click event to open link
 
     # Start the GUI loop
+    root.after(FRAME_INTERVAL_MS, drain_progress)
     root.mainloop()
 
 import subprocess
@@ -558,10 +629,11 @@ import time
 def check_ffmpeg_in_path():
     try:
         # Attempt to run the FFmpeg command with the version flag
-        subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        # A broken install or a binary on a stalled network drive can hang instead of failing
+        subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, timeout=10)
         print("found")
         cutter()
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
         result = input("FFmpeg is not installed or not in the PATH. \nDo you want to install now ? Y/n   ")
         if result == "Y":
             installer()
@@ -578,4 +650,5 @@ def check_ffmpeg_in_path():
             time.sleep(5)
 
 # Call the function to print the result
-check_ffmpeg_in_path()
+if __name__ == "__main__":
+    check_ffmpeg_in_path()
@@ -0,0 +1,130 @@
+"""Per-stage timing metrics for the segment pipeline.
+
+Every timed stage (scan, probe, plan, encode, finalize) can be appended to a
+JSON-lines file as it finishes, and the running totals can be kept in a
+Prometheus text file for the node exporter's textfile collector.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "segmentcutter"
+
+# Upper bounds in seconds, shared by every stage
+HISTOGRAM_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+COUNTERS = {
+    "segments_done_total": "Segments written successfully.",
+    "segments_failed_total": "Segments whose ffmpeg process failed.",
+    "bytes_written_total": "Bytes of segment files written.",
+    "probes_total": "ffprobe calls that were not served from the catalog.",
+    "cache_hits_total": "Segments served from the segment cache instead of ffmpeg.",
+}
+
+# Write the Prometheus file at most this often, the final state is always written by flush()
+PROMETHEUS_INTERVAL = 1.0
+
+
+class Metrics:
+    """Thread-safe counters and stage histograms, optionally mirrored to files."""
+
+    def __init__(self, events_path=None, prometheus_path=None):
+        self.events_path = events_path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._events_file = open(events_path, "a") if events_path else None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._histograms = {}  # stage -> [bucket counts..., sum, count]
+        self._last_prometheus_write = 0.0
+
+    def event(self, stage, **fields):
+        """Append one JSON-lines event."""
+        if self._events_file is None:
+            return
+        line = json.dumps({"ts": time.time(), "stage": stage, **fields})
+        with self._lock:
+            self._events_file.write(line + "\n")
+            self._events_file.flush()
+
+    def observe(self, stage, seconds, **fields):
+        """Record a finished stage in its histogram and the events file."""
+        with self._lock:
+            histogram = self._histograms.setdefault(stage, [0] * len(HISTOGRAM_BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+        self.event(stage, seconds=seconds, **fields)
+        self._maybe_write_prometheus()
+
+    @contextmanager
+    def stage(self, stage, **fields):
+        """Time the body of a with block as one stage; fields set on the yielded dict are recorded too."""
+        started = time.perf_counter()
+        extra = {}
+        try:
+            yield extra
+        except Exception as e:
+            extra["error"] = type(e).__name__
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started, **fields, **extra)
+
+    def stage_seconds(self, stage):
+        """Return the total time and the number of observations recorded for a stage."""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            return (histogram[-2], histogram[-1]) if histogram else (0.0, 0)
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+        self._maybe_write_prometheus()
+
+    def prometheus_text(self):
+        """Render the current state in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, help_text in COUNTERS.items():
+                lines += [f"# HELP {PREFIX}_{name} {help_text}",
+                          f"# TYPE {PREFIX}_{name} counter",
+                          f"{PREFIX}_{name} {self.counters[name]}"]
+            lines += [f"# HELP {PREFIX}_stage_seconds Wall-clock time spent per pipeline stage.",
+                      f"# TYPE {PREFIX}_stage_seconds histogram"]
+            for stage, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(HISTOGRAM_BUCKETS, histogram):
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines += [f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram[-1]}',
+                          f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram[-2]}',
+                          f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {histogram[-1]}']
+        return "\n".join(lines) + "\n"
+
+    def _maybe_write_prometheus(self):
+        if self.prometheus_path and time.monotonic() - self._last_prometheus_write >= PROMETHEUS_INTERVAL:
+            self.write_prometheus()
+
+    def write_prometheus(self):
+        """Replace the Prometheus file atomically, so the exporter never reads half a file."""
+        if not self.prometheus_path:
+            return
+        self._last_prometheus_write = time.monotonic()
+        temp_path = f"{self.prometheus_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, self.prometheus_path)
+
+    def flush(self):
+        """Write the final state of every file."""
+        self.write_prometheus()
+        if self._events_file is not None:
+            with self._lock:
+                self._events_file.flush()
+
+    def close(self):
+        self.flush()
+        if self._events_file is not None:
+            self._events_file.close()
+            self._events_file = None
@@ -0,0 +1,97 @@
+"""Up-front segment planning from catalogued durations.
+
+The requested count is first spread over the sources: each segment goes to a
+source drawn in proportion to its usable length (duration minus segment
+length) among those that still have room, and sources shorter than a segment
+are never drawn. Then every source gets its k starts placed in one go, so k
+segments are always found a place when k fit: k offsets are drawn from the
+room that k back-to-back segments leave, sorted, and pushed apart by one
+segment each. Segments of one source overlap by at most max_overlap seconds.
+"""
+import bisect
+import random
+from itertools import accumulate
+
+# Starts are planned to the millisecond, so two segments never share one even when any overlap is allowed
+MIN_STEP = 0.001
+# Slack for float rounding when checking that two starts are a step apart
+TOLERANCE = 1e-9
+
+
+def capacity(usable, step, candidates=None):
+    """Return how many segments fit in a source whose starts may go from 0 to usable, step seconds apart.
+
+    candidates, if given, are the sorted start times allowed (keyframes for stream copy).
+    """
+    if candidates is None:
+        return int(usable / step + TOLERANCE) + 1
+    count = 0
+    last = None
+    for start in candidates[:bisect.bisect_right(candidates, usable)]:
+        if last is None or start >= last + step - TOLERANCE:
+            count += 1
+            last = start
+    return count
+
+
+def place_starts(usable, step, k, candidates=None, rng=random):
+    """Return k sorted starts between 0 and usable that are at least step apart; k must fit (see capacity)."""
+    if candidates is None:
+        # Uniform over every placement: k points in the room left after k - 1 steps, spread back out
+        room = usable - (k - 1) * step
+        offsets = sorted(rng.uniform(0, max(room, 0.0)) for _ in range(k))
+        return [offset + i * step for i, offset in enumerate(offsets)]
+    candidates = candidates[:bisect.bisect_right(candidates, usable)]
+    # The latest each start may be so that the ones after it still fit, packed from the end
+    latest = []
+    for start in reversed(candidates):
+        if not latest or start <= latest[-1] - step + TOLERANCE:
+            latest.append(start)
+            if len(latest) == k:
+                break
+    latest.reverse()
+    starts = []
+    for limit in latest:
+        low = bisect.bisect_left(candidates, starts[-1] + step - TOLERANCE) if starts else 0
+        high = bisect.bisect_right(candidates, limit)
+        starts.append(candidates[rng.randrange(low, high)])
+    return starts
+
+
+def plan_starts(durations, count, duration, max_overlap=0.0, candidates=None, rng=random):
+    """Plan up to count (source, start) pairs in one pass.
+
+    durations maps each source to its length in seconds (None if unknown).
+    candidates, if given, is called with a source and returns the sorted start
+    times allowed there (its keyframes for stream copy), or None for any time.
+    Fewer than count pairs are returned only when the sources cannot hold more.
+    """
+    usable = {source: length - duration for source, length in durations.items()
+              if length is not None and length >= duration}
+    step = max(duration - max_overlap, MIN_STEP)
+    allowed = {}
+    room = {}  # source -> how many segments fit in it
+    counts = {source: 0 for source in usable}
+    sources = list(usable)
+    cumulative = None
+    drawn = 0
+    while drawn < count and sources:  # Stops early only when every source is full
+        if cumulative is None:
+            # A source that is exactly one segment long still has one start, give it a small weight
+            cumulative = list(accumulate(max(usable[source], 0.001) for source in sources))
+        source = rng.choices(sources, cum_weights=cumulative)[0]
+        if source not in room:
+            allowed[source] = candidates(source) if candidates else None
+            room[source] = capacity(usable[source], step, allowed[source])
+        if counts[source] < room[source]:
+            counts[source] += 1
+            drawn += 1
+        if counts[source] >= room[source]:
+            # Full (or no allowed start at all, which costs no segment), stop drawing it
+            sources.remove(source)
+            cumulative = None
+    planned = []
+    for source, k in counts.items():
+        if k:
+            planned.extend((source, start) for start in place_starts(usable[source], step, k, allowed[source], rng))
+    return planned
@@ -0,0 +1,63 @@
+"""Parse the machine-readable progress that ffmpeg writes with -progress.
+
+ffmpeg prints blocks of key=value lines, each ending with progress=continue
+(or progress=end for the last one):
+
+    frame=250
+    fps=98.40
+    out_time_us=10000000
+    speed=3.94x
+    progress=continue
+"""
+
+# Global options that make ffmpeg write progress blocks to stdout instead of the stats line on stderr
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+
+def with_progress(command):
+    """Return an ffmpeg command that reports its progress on stdout."""
+    return command[:1] + PROGRESS_ARGS + command[1:]
+
+
+def _number(value):
+    try:
+        return float(value.rstrip("x"))
+    except (AttributeError, ValueError):
+        return None  # "N/A" before the first frame is out
+
+
+class ProgressParser:
+    """Incremental parser for one ffmpeg process; feed() it stdout lines."""
+
+    def __init__(self, expected_seconds=None):
+        self.expected_seconds = expected_seconds
+        self._block = {}
+
+    def feed(self, line):
+        """Consume one line; return a progress snapshot when a block is complete, else None."""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self._block[key] = value
+            return None
+        block, self._block = self._block, {}
+        # out_time_ms is in microseconds as well, kept for older ffmpeg builds
+        out_time_us = _number(block.get("out_time_us", block.get("out_time_ms")))
+        out_seconds = max(out_time_us / 1e6, 0.0) if out_time_us is not None else None
+        speed = _number(block.get("speed"))
+        snapshot = {
+            "frame": int(_number(block.get("frame")) or 0),
+            "fps": _number(block.get("fps")) or 0.0,
+            "speed": speed,
+            "out_seconds": out_seconds,
+            "fraction": None,
+            "eta": None,
+            "finished": value == "end",
+        }
+        if self.expected_seconds and out_seconds is not None:
+            snapshot["fraction"] = 1.0 if value == "end" else min(out_seconds / self.expected_seconds, 1.0)
+            if speed:
+                # speed is media seconds per wall-clock second
+                snapshot["eta"] = max(self.expected_seconds - out_seconds, 0.0) / speed
+        return snapshot
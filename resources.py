@@ -0,0 +1,103 @@
+"""CPU time and peak memory of every ffmpeg/ffprobe child process.
+
+Children are reaped with os.wait4 so each one's own rusage is available, not
+just the total for all children. Platforms without wait4 (Windows) get the
+exit status only.
+"""
+import contextlib
+import os
+import re
+import subprocess
+import sys
+import threading
+
+USAGE_FIELDS = ("user_seconds", "system_seconds", "max_rss_kb", "blocks_in", "blocks_out")
+
+# Lines ffmpeg writes to stderr with -benchmark
+BENCH_TIMES = re.compile(r"bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s")
+BENCH_MAXRSS = re.compile(r"bench: maxrss=(\d+)(KiB|kB)")
+
+
+def usage_from_rusage(rusage):
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    max_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+    # Block I/O counts what went to or came from storage, page cache hits are not included
+    return {"user_seconds": rusage.ru_utime, "system_seconds": rusage.ru_stime, "max_rss_kb": max_rss_kb,
+            "blocks_in": rusage.ru_inblock, "blocks_out": rusage.ru_oublock}
+
+
+def wait(process):
+    """Wait for a Popen child and return (returncode, usage), usage is None where wait4 is missing."""
+    if hasattr(os, "wait4"):
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            pass  # Already reaped elsewhere, only the exit status is left
+        else:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return process.returncode, usage_from_rusage(rusage)
+    return process.wait(), None
+
+
+def run_capture(command, usage=None, timeout=None, track=None):
+    """Like subprocess.check_output, also filling the usage dict (if given) with the child's rusage.
+
+    track, if given, is called with the running Popen and returns a context manager held until the child exits,
+    so an owner can register the process (and kill it on cancel).
+    """
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        process.kill()  # Closes the child's stdout, which ends the read below
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        with track(process) if track else contextlib.nullcontext(), process.stdout:
+            output = process.stdout.read()
+            returncode, child_usage = wait(process)
+    finally:
+        if timer:
+            timer.cancel()
+    if usage is not None and child_usage:
+        usage.update(child_usage)
+    if timed_out.is_set() and returncode:
+        raise subprocess.TimeoutExpired(command, timeout, output=output)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, command, output=output)
+    return output
+
+
+def parse_benchmark(line, benchmark):
+    """Fold one ffmpeg -benchmark stderr line into the benchmark dict; return True if it was one."""
+    match = BENCH_TIMES.search(line)
+    if match:
+        benchmark.update(utime=float(match[1]), stime=float(match[2]), rtime=float(match[3]))
+        return True
+    match = BENCH_MAXRSS.search(line)
+    if match:
+        benchmark["maxrss_kb"] = int(match[1])
+        return True
+    return False
+
+
+def new_summary():
+    return {"processes": 0, "failed": 0, "user_seconds": 0.0, "system_seconds": 0.0, "max_rss_kb": 0,
+            "blocks_in": 0, "blocks_out": 0}
+
+
+def add_to_summary(summary, usage, returncode=0):
+    """Add one child's usage to a summary: CPU times are summed, peak memory is the largest seen."""
+    summary["processes"] += 1
+    if returncode:
+        summary["failed"] += 1
+    if usage:
+        summary["user_seconds"] += usage["user_seconds"]
+        summary["system_seconds"] += usage["system_seconds"]
+        summary["max_rss_kb"] = max(summary["max_rss_kb"], usage["max_rss_kb"])
+        summary["blocks_in"] += usage["blocks_in"]
+        summary["blocks_out"] += usage["blocks_out"]
+    return summary
@@ -0,0 +1,92 @@
+"""Streaming discovery of the source videos in a folder tree.
+
+Files are yielded while the tree is being read, using the file type os.scandir
+already returns, so an entry is never stat'ed just to find out what it is.
+"""
+import os
+import random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+VIDEO_EXTENSIONS = ['.mp4', '.mkv', '.avi', '.mov']
+
+
+def is_video(name):
+    return os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+
+
+def _scan_dir(path, exclude, top=False):
+    """Return the videos and subdirectories of one directory."""
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.abspath(entry.path) not in exclude:
+                        dirs.append(entry.path)
+                elif is_video(entry.name) and entry.is_file():
+                    files.append(entry.path)
+    except OSError:
+        if top:
+            raise
+        # An unreadable subfolder should not stop the whole scan
+    return files, dirs
+
+
+def _walk(folder, recursive, exclude):
+    pending = [folder]
+    while pending:
+        path = pending.pop()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and os.path.abspath(entry.path) not in exclude:
+                            pending.append(entry.path)
+                    elif is_video(entry.name) and entry.is_file():
+                        yield entry.path
+        except OSError:
+            if path is folder:
+                raise
+
+
+def _walk_parallel(folder, walkers, exclude):
+    # Network shares answer slowly per directory, so several directories are read at once
+    with ThreadPoolExecutor(max_workers=walkers) as pool:
+        pending = {pool.submit(_scan_dir, folder, exclude, True)}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, dirs = future.result()
+                    pending.update(pool.submit(_scan_dir, path, exclude) for path in dirs)
+                    yield from files
+        finally:
+            # The caller may stop early, do not read the rest of the tree
+            for future in pending:
+                future.cancel()
+
+
+def iter_videos(folder, recursive=False, walkers=1, exclude=()):
+    """Yield the path of every video in folder (and its subfolders when recursive), in no particular order.
+
+    walkers > 1 reads that many directories at once. Folders in exclude (absolute paths) are skipped.
+    """
+    exclude = {os.path.abspath(path) for path in exclude}
+    if recursive and walkers > 1:
+        return _walk_parallel(folder, walkers, exclude)
+    return _walk(folder, recursive, exclude)
+
+
+def reservoir_sample(items, k, rng=random):
+    """Return k items chosen uniformly from an iterable of unknown length, holding only k of them at a time."""
+    sample = []
+    for seen, item in enumerate(items):
+        if seen < k:
+            sample.append(item)
+        else:
+            # Keep the new item with probability k / (seen + 1), replacing a random one
+            index = rng.randrange(seen + 1)
+            if index < k:
+                sample[index] = item
+    return sample
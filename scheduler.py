@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+
+# Shrink when the 1-minute load average per core goes above this
+OVERLOAD = 1.5
+# A new window must beat the previous one by this much to keep moving in the same direction
+TOLERANCE = 0.03
+
+
+class AdaptiveScheduler:
+    """Choose how many ffmpeg jobs to run at once and how many encoder threads each gets.
+
+    Starts from the core count (a quarter of the cores as jobs, the cores shared
+    out as threads), then hill-climbs: after every measurement window it keeps
+    moving the job count in the same direction while segments/sec improves,
+    reverses when it gets worse, and backs off when the machine is overloaded.
+    """
+
+    def __init__(self, cores=None, min_jobs=1, max_jobs=None, window_seconds=10.0):
+        self.cores = cores or os.cpu_count() or 1
+        self.min_jobs = min_jobs
+        self.max_jobs = max_jobs or self.cores
+        self.window_seconds = window_seconds
+        self.jobs = self._clamp(self.cores // 4)
+        self.history = []  # One entry per finished window
+        self._lock = threading.Lock()
+        self._direction = 1
+        self._last_rate = None
+        self._window_started = time.monotonic()
+        self._window_segments = 0
+
+    def start(self):
+        """Begin a new measurement window, call when the job starts cutting."""
+        with self._lock:
+            self._window_started = time.monotonic()
+            self._window_segments = 0
+
+    def _clamp(self, jobs):
+        return max(self.min_jobs, min(self.max_jobs, jobs))
+
+    @property
+    def threads(self):
+        """Encoder threads per job, so that all jobs together use every core once."""
+        return max(1, self.cores // self.jobs)
+
+    def record(self, segments):
+        """Count finished segments; return the new decision dict when the job count changed, else None."""
+        with self._lock:
+            self._window_segments += segments
+            now = time.monotonic()
+            elapsed = now - self._window_started
+            # Wait for a full window and at least one result per running job before judging it
+            if elapsed < self.window_seconds or self._window_segments < self.jobs:
+                return None
+            rate = self._window_segments / elapsed
+            load = os.getloadavg()[0] / self.cores if hasattr(os, "getloadavg") else None
+
+            if load is not None and load > OVERLOAD:
+                self._direction = -1
+            elif self._last_rate is not None and rate < self._last_rate * (1 + TOLERANCE):
+                self._direction = -self._direction
+            previous = self.jobs
+            self.jobs = self._clamp(self.jobs + self._direction)
+            self._last_rate = rate
+            self._window_started = now
+            self._window_segments = 0
+
+            decision = {"jobs": self.jobs, "threads": self.threads, "rate": rate, "load": load}
+            self.history.append(decision)
+            return decision if self.jobs != previous else None
@@ -0,0 +1,58 @@
+"""Cancel a job while its sources are still being probed."""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from catalog import MediaCatalog  # noqa: E402
+from engine import SegmentEngine  # noqa: E402
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="uses a shell script as ffprobe")
+
+
+def hanging_ffprobe(tmp_path, monkeypatch):
+    """Put an ffprobe that hangs, like one on a stalled network share, first on PATH; return a folder of sources."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "ffprobe").write_text("#!/bin/sh\nexec sleep 60\n")
+    (bin_dir / "ffprobe").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    (tmp_path / "in").mkdir()
+    for name in ("a.mp4", "b.mp4"):
+        (tmp_path / "in" / name).write_bytes(b"not really a video")
+    return str(tmp_path / "in")
+
+
+def cancel_scan(engine, folder):
+    """Start a scan, cancel it once an ffprobe is running and return whether the scan stopped within 5 s."""
+    scanned = []
+    scan = threading.Thread(target=lambda: scanned.append(engine.scan(folder)))
+    scan.start()
+    deadline = time.monotonic() + 10
+    while not engine._probes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert engine._probes
+
+    engine.cancel()
+    scan.join(5)
+    return not scan.is_alive() and len(scanned[0]) == 2
+
+
+def test_cancel_kills_running_probes(tmp_path, monkeypatch):
+    engine = SegmentEngine(catalog=MediaCatalog(":memory:"), workers=2)
+    assert cancel_scan(engine, hanging_ffprobe(tmp_path, monkeypatch))
+    assert not engine._probes
+
+
+def test_cancel_with_a_shared_catalog(tmp_path, monkeypatch):
+    # The GUI keeps one catalog and makes a new engine for every job
+    folder = hanging_ffprobe(tmp_path, monkeypatch)
+    catalog = MediaCatalog(":memory:")
+    assert cancel_scan(SegmentEngine(catalog=catalog, workers=2), folder)
+    assert cancel_scan(SegmentEngine(catalog=catalog, workers=2), folder)
+    assert catalog.track is None
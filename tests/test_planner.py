@@ -0,0 +1,84 @@
+"""Planning of segment starts, no ffmpeg needed."""
+import os
+import random
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from planner import capacity, place_starts, plan_starts  # noqa: E402
+
+SEEDS = range(200)
+
+
+def by_source(planned):
+    starts = {}
+    for source, start in planned:
+        starts.setdefault(source, []).append(start)
+    return {source: sorted(times) for source, times in starts.items()}
+
+
+def assert_apart(starts, step):
+    assert all(later - earlier >= step - 1e-6 for earlier, later in zip(starts, starts[1:]))
+
+
+def test_capacity():
+    assert capacity(0.0, 10) == 1
+    assert capacity(30.0, 10) == 4
+    assert capacity(29.9, 10) == 3
+    assert capacity(30.0, 10, [0.0, 4.0, 12.0, 19.0, 25.0, 40.0]) == 3  # 0, 12, 25
+    assert capacity(0.2, 10, [0.5, 3.0]) == 0
+
+
+@pytest.mark.parametrize("k", [1, 3, 4])
+def test_place_starts_continuous(k):
+    for seed in SEEDS:
+        starts = place_starts(30.0, 10, k, rng=random.Random(seed))
+        assert len(starts) == k
+        assert 0 <= starts[0] and starts[-1] <= 30.0 + 1e-9
+        assert_apart(starts, 10)
+
+
+def test_place_starts_on_candidates():
+    keyframes = [i * 2.0 for i in range(50)]
+    for seed in SEEDS:
+        starts = place_starts(90.0, 10, 10, keyframes, random.Random(seed))
+        assert len(starts) == 10
+        assert set(starts) <= set(keyframes) and starts[-1] <= 90.0
+        assert_apart(starts, 10)
+
+
+def test_plan_starts_reaches_the_count_when_it_fits():
+    durations = {"a": 40.0, "b": 30.0}  # Room for 4 + 3 segments of 10 s
+    for seed in SEEDS:
+        planned = plan_starts(durations, 7, 10, rng=random.Random(seed))
+        assert len(planned) == 7
+        for source, starts in by_source(planned).items():
+            assert starts[-1] <= durations[source] - 10 + 1e-9
+            assert_apart(starts, 10)
+
+
+def test_plan_starts_stops_when_the_sources_are_full():
+    assert len(plan_starts({"a": 40.0, "b": 30.0}, 9, 10)) == 7
+
+
+def test_plan_starts_allows_max_overlap():
+    for seed in SEEDS:
+        planned = plan_starts({"a": 60.0}, 11, 10, max_overlap=5, rng=random.Random(seed))
+        assert len(planned) == 11
+        assert_apart(by_source(planned)["a"], 5)
+
+
+def test_plan_starts_skips_short_and_unknown_sources():
+    planned = plan_starts({"a": 100.0, "short": 5.0, "unknown": None}, 5, 10)
+    assert {source for source, _ in planned} == {"a"}
+
+
+def test_source_without_an_allowed_start_costs_no_segment():
+    keyframes = {"a": [0.5, 3.0], "b": None}  # No keyframe of a leaves room for a 10 s segment
+    for seed in SEEDS:
+        planned = plan_starts({"a": 10.2, "b": 100.0}, 5, 10, candidates=keyframes.get, rng=random.Random(seed))
+        assert len(planned) == 5
+        assert {source for source, _ in planned} == {"b"}
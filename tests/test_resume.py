@@ -0,0 +1,64 @@
+"""Kill a command-line job mid-run and check that running it again finishes it."""
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from cache import part_path  # noqa: E402
+from journal import JOURNAL_NAME  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not (shutil.which("ffmpeg") and shutil.which("ffprobe")),
+                                reason="needs ffmpeg and ffprobe")
+
+
+def make_source(path, seconds):
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", f"testsrc2=size=320x240:rate=25:duration={seconds}",
+                    "-f", "lavfi", "-i", f"sine=duration={seconds}", "-c:v", "libx264", "-preset", "ultrafast",
+                    "-c:a", "aac", "-shortest", path], check=True)
+
+
+def cli(tmp_path, *extra):
+    return [sys.executable, os.path.join(REPO, "cli.py"), "--input", str(tmp_path / "in"),
+            "--output", str(tmp_path / "out"), "--duration", "2", "--count", "12", "--workers", "1",
+            "--catalog", str(tmp_path / "catalog.sqlite3"), "--no-cache", *extra]
+
+
+def test_killed_job_resumes(tmp_path):
+    (tmp_path / "in").mkdir()
+    make_source(str(tmp_path / "in" / "a.mp4"), 30)
+    make_source(str(tmp_path / "in" / "b.mp4"), 30)
+
+    # Kill the whole process group after the first finished segment, the way a crash or reboot would
+    job = subprocess.Popen(cli(tmp_path), stdout=subprocess.PIPE, text=True, start_new_session=True)
+    for line in job.stdout:
+        if json.loads(line)["event"] == "segment":
+            os.killpg(job.pid, signal.SIGKILL)
+            break
+    job.wait()
+    job.stdout.close()
+
+    # Whatever ffmpeg was writing when it died is left as a .part file; make sure every pending one has one
+    with open(tmp_path / "out" / JOURNAL_NAME) as f:
+        outputs = [record["output"] for record in map(json.loads, f) if record["type"] == "plan"]
+    pending = [output for output in outputs if not os.path.exists(output)]
+    assert pending
+    for output in pending:
+        with open(part_path(output), "ab") as f:
+            f.write(b"truncated")
+
+    result = subprocess.run(cli(tmp_path), stdout=subprocess.PIPE, text=True, check=True)
+    events = [json.loads(line) for line in result.stdout.splitlines()]
+    resume = next(event for event in events if event["event"] == "resume")
+    # Outputs finished but not yet journaled when the job died are cut again too
+    assert resume["pending"] >= len(pending)
+    assert not [event for event in events if event["event"] == "failed"]
+    assert events[-1]["event"] == "finish" and events[-1]["created"] == resume["pending"]
+    assert all(os.path.getsize(output) > 0 for output in outputs)
+    assert not [name for name in os.listdir(tmp_path / "out") if ".part." in name]
@@ -0,0 +1,210 @@
+"""Incremental detection of new and changed videos for the watch-folder mode.
+
+On Linux the watcher is woken by inotify (through libc, no extra package);
+elsewhere, or on file systems where inotify sees nothing (network shares
+written by other machines), it polls directory modification times and only
+lists the directories that changed. Either way a file is handed out only once
+its size and modification time have stopped changing for settle_seconds.
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+
+from scanner import is_video
+
+DEFAULT_SETTLE_SECONDS = 10.0
+DEFAULT_POLL_SECONDS = 5.0
+WATCH_STATE_NAME = ".segmentcutter-watched.jsonl"
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal inotify binding: add_watch() directories, read() the (directory, name, mask) events."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}  # watch descriptor -> directory
+
+    def add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self._dirs[wd] = directory
+
+    def read(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)  # The directory is gone
+            elif mask & IN_Q_OVERFLOW:
+                events.append((None, None, mask))
+            elif wd in self._dirs:
+                events.append((self._dirs[wd], name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Hand out each new or changed video of a folder once it has finished being written."""
+
+    def __init__(self, folder, recursive=False, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 poll_seconds=DEFAULT_POLL_SECONDS, exclude=(), known=None, use_inotify=True):
+        self.folder = folder
+        self.recursive = recursive
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.exclude = {os.path.abspath(path) for path in exclude}
+        self.known = dict(known or {})  # path -> (size, mtime_ns) already handed out
+        self._pending = {}  # path -> (size, mtime_ns, unchanged since)
+        self._dirs = {}  # directory -> mtime_ns when it was last listed
+        self._last_poll = 0.0
+        self._inotify = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                self._inotify = None  # No inotify in this libc, poll instead
+        self._add_directory(folder)
+
+    @property
+    def mode(self):
+        return "inotify" if self._inotify else "polling"
+
+    def _add_directory(self, directory):
+        if self._inotify:
+            # Watch first, then list, so a file created in between is seen at least once
+            self._inotify.add_watch(directory)
+        self._list_directory(directory)
+
+    def _list_directory(self, directory):
+        try:
+            self._dirs[directory] = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if (self.recursive and entry.path not in self._dirs
+                                and os.path.abspath(entry.path) not in self.exclude):
+                            self._add_directory(entry.path)
+                    elif is_video(entry.name) and entry.is_file():
+                        self._consider(entry.path)
+        except FileNotFoundError:
+            self._dirs.pop(directory, None)
+
+    def _consider(self, path):
+        """Start or restart the settle timer of a file that may be new or changed."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._pending.pop(path, None)
+            return
+        identity = (st.st_size, st.st_mtime_ns)
+        if self.known.get(path) == identity:
+            return
+        pending = self._pending.get(path)
+        if pending is None or pending[:2] != identity:
+            self._pending[path] = identity + (time.monotonic(),)
+
+    def _check_changes(self, timeout):
+        if self._inotify:
+            for directory, name, mask in self._inotify.read(timeout):
+                if directory is None:
+                    # The kernel dropped events, fall back to listing everything once
+                    for listed in list(self._dirs):
+                        self._list_directory(listed)
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and self.recursive and path not in self._dirs \
+                            and os.path.abspath(path) not in self.exclude:
+                        self._add_directory(path)
+                elif is_video(name):
+                    self._consider(path)
+            return
+        time.sleep(timeout)
+        if time.monotonic() - self._last_poll < self.poll_seconds:
+            return
+        self._last_poll = time.monotonic()
+        # A directory's mtime changes when entries are added, removed or renamed in it
+        for directory, mtime_ns in list(self._dirs.items()):
+            try:
+                if os.stat(directory).st_mtime_ns != mtime_ns:
+                    self._list_directory(directory)
+            except FileNotFoundError:
+                self._dirs.pop(directory, None)
+
+    def poll(self, timeout=1.0):
+        """Wait up to timeout for changes; return the files that have stopped changing since the last call."""
+        self._check_changes(timeout)
+        ready = []
+        now = time.monotonic()
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (st.st_size, st.st_mtime_ns, now)  # Still being written
+            elif now - since >= self.settle_seconds:
+                del self._pending[path]
+                self.known[path] = (size, mtime_ns)
+                ready.append(path)
+        return ready
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+
+
+def load_watch_state(path):
+    """Read the files a previous watch run finished, as {path: (size, mtime_ns)}."""
+    known = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn by a crash, that file is simply processed again
+                known[record["path"]] = (record["size"], record["mtime_ns"])
+    except FileNotFoundError:
+        pass
+    return known
+
+
+def append_watch_state(path, input_file, size, mtime_ns):
+    with open(path, "a") as f:
+        f.write(json.dumps({"path": input_file, "size": size, "mtime_ns": mtime_ns}) + "\n")